@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+
+# off by default: a cached answer to a similar question replaces a fresh one
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# how long a worker trusts its last read of ingest_state.version
+ANSWER_CACHE_VERSION_TTL = float(os.getenv("ANSWER_CACHE_VERSION_TTL", "2"))
+
+
+class AnswerCache:
+    """Semantic cache of /ask responses.
+
+    Entries are looked up by cosine similarity of the question embedding.
+    All entries belong to one ingest version; seeing a newer version drops
+    them, so answers never outlive the documents they were built from.
+    Each entry carries a scope (the collection and retrieval settings it
+    was answered with) and only matches lookups with that same scope."""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[dict] = []
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _check_version(self, version: int) -> None:
+        if self._version != version:
+            if self._entries:
+                self.invalidations += 1
+            self._vectors = None
+            self._entries = []
+            self._version = version
+
+    def lookup(self, embedding, version: int, scope: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            scores = self._vectors @ self._unit(embedding)
+            scores[[i for i, e in enumerate(self._entries) if e["scope"] != scope]] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            entry["last_used"] = time.monotonic()
+            return {"answer": entry["answer"], "top_chunks": entry["top_chunks"],
+                    "similarity": float(scores[best])}
+
+    def store(self, embedding, version: int, answer: str, top_chunks: Any, scope: Optional[str] = None) -> None:
+        with self._lock:
+            self._check_version(version)
+            row = self._unit(embedding)[None, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._entries.append({
+                "answer": answer, "top_chunks": top_chunks, "scope": scope, "last_used": time.monotonic(),
+            })
+            if len(self._entries) > self.maxsize:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                del self._entries[lru]
+                self._vectors = np.delete(self._vectors, lru, axis=0)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._check_version(-1)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: Optional[AnswerCache] = None
+_version = (0.0, 0)
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        _cache = AnswerCache()
+    return _cache
+
+
+async def aingest_version() -> int:
+    """Current ingest_state.version, re-read at most every
+    ANSWER_CACHE_VERSION_TTL seconds per worker."""
+    global _version
+    checked_at, version = _version
+    if time.monotonic() - checked_at < ANSWER_CACHE_VERSION_TTL:
+        return version
+    from local_store import get_local_store, use_local_backend
+
+    if use_local_backend():
+        # the local store only grows, so its row count works as a version
+        return len(get_local_store())
+    from db_pool import async_conn
+    from vector_store import INGEST_VERSION_SQL
+
+    try:
+        async with async_conn() as conn:
+            cur = await conn.execute(INGEST_VERSION_SQL)
+            row = await cur.fetchone()
+        version = row[0] if row else 0
+    except Exception:
+        # schema not created yet, or DB down: keep the last known version
+        pass
+    _version = (time.monotonic(), version)
+    return version
+
+
+def reset_ingest_version() -> None:
+    """Force the next aingest_version() to hit the database."""
+    global _version
+    _version = (0.0, _version[1])
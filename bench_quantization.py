@@ -0,0 +1,179 @@
+"""Recall and latency of quantized first-pass search.
+
+Local store: builds one index (synthetic clustered vectors, or the rows of
+an existing --from-store directory) and searches it with every
+VECTOR_QUANTIZATION, scoring each against the exact float32 results.
+--postgres instead checks the configured database: search() with its
+quantization and ANN index vs an exact sequential scan.
+
+    python bench_quantization.py --rows 50000 --queries 200 --k 5
+    python bench_quantization.py --rescore 50 --from-store ./local_index
+    VECTOR_QUANTIZATION=binary python bench_quantization.py --postgres
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+QUANTIZATIONS = ["none", "halfvec", "int8", "binary"]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 6)
+
+
+def latency_summary(latencies):
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+    }
+
+
+def synthetic_vectors(rows, dim, clusters, seed):
+    """Gaussian clusters, roughly how sentence embeddings of a few
+    documents spread out."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def make_queries(vectors, n, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.integers(0, len(vectors), size=n)]
+    return picks + 0.3 * rng.normal(size=picks.shape).astype(np.float32)
+
+
+def recall(found, truth):
+    return len(set(found) & set(truth)) / len(truth) if truth else 1.0
+
+
+def bench_local(args):
+    from local_store import LocalVectorStore
+
+    if args.from_store:
+        with open(os.path.join(args.from_store, "meta.json")) as f:
+            meta = json.load(f)
+        vectors = np.array(np.memmap(
+            os.path.join(args.from_store, "embeddings.f32"), dtype=np.float32, mode="r",
+            shape=(meta["count"], meta["dim"]),
+        ))
+    else:
+        vectors = synthetic_vectors(args.rows, args.dim, args.clusters, args.seed)
+    path = tempfile.mkdtemp(prefix="bench_quant_")
+    start = time.perf_counter()
+    LocalVectorStore(path, dim=vectors.shape[1], quantization="none").add(
+        [f"row {i}" for i in range(len(vectors))], vectors,
+    )
+    print(f"indexed {len(vectors)} x {vectors.shape[1]} rows in {time.perf_counter() - start:.1f}s")
+    queries = make_queries(vectors, args.queries, args.seed)
+
+    results, truth = {}, None
+    for quantization in args.quantizations:
+        start = time.perf_counter()
+        store = LocalVectorStore(path, dim=vectors.shape[1], quantization=quantization)
+        load_s = time.perf_counter() - start
+        latencies, found = [], []
+        for q in queries:
+            t = time.perf_counter()
+            rows = store.search(q, top_k=args.k, diversify=False)
+            latencies.append(time.perf_counter() - t)
+            found.append([r[0] for r in rows])
+        if truth is None:
+            # exact float32 scan; "none" always runs first
+            truth = found
+        memory = store.memory_bytes()
+        scanned = memory["codes"] if quantization != "none" else memory["float32"]
+        results[quantization] = {
+            f"recall@{args.k}": round(sum(recall(f, t) for f, t in zip(found, truth)) / len(queries), 4),
+            "latency": latency_summary(latencies),
+            "scanned_bytes": scanned,
+            "compression": round(memory["float32"] / scanned, 1) if scanned else None,
+            "load_s": round(load_s, 3),
+        }
+        print(f"{quantization:>8}: {results[quantization]}")
+    return {"rows": len(vectors), "dim": int(vectors.shape[1]), "results": results}
+
+
+def bench_postgres(args):
+    from db_pool import get_conn
+    from rerank import parse_vector
+    from vector_store import (
+        PG_QUANTIZATION, RESCORE_CANDIDATES, VECTOR_INDEX, distance_sql, ensure_schema, index_name,
+        search, vector_literal,
+    )
+
+    with get_conn() as conn:
+        ensure_schema(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT embedding::text FROM documents ORDER BY random() LIMIT %s", (args.queries,))
+            samples = np.array([parse_vector(r[0]) for r in cur.fetchall()])
+            cur.execute("SELECT pg_relation_size(%s::regclass), pg_relation_size('documents')", (index_name(),))
+            index_bytes, table_bytes = cur.fetchone()
+        conn.rollback()
+        if not len(samples):
+            raise SystemExit("documents is empty; ingest something first")
+        queries = make_queries(samples, args.queries, args.seed)
+        exact_sql = f"SELECT text FROM documents ORDER BY {distance_sql()} LIMIT %(limit)s"
+        latencies, recalls = [], []
+        for q in queries:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL enable_indexscan = off")
+                cur.execute(exact_sql, {"q": vector_literal(q), "limit": args.k})
+                truth = [r[0] for r in cur.fetchall()]
+            conn.rollback()
+            t = time.perf_counter()
+            rows = search(conn, q, top_k=args.k, diversify=False)
+            latencies.append(time.perf_counter() - t)
+            recalls.append(recall([r[0] for r in rows], truth))
+    result = {
+        "quantization": PG_QUANTIZATION,
+        "index": VECTOR_INDEX,
+        "rescore_candidates": RESCORE_CANDIDATES,
+        f"recall@{args.k}": round(sum(recalls) / len(recalls), 4),
+        "latency": latency_summary(latencies),
+        "index_bytes": index_bytes,
+        "table_bytes": table_bytes,
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postgres", action="store_true", help="benchmark the configured database instead")
+    parser.add_argument("--from-store", help="local index directory to take vectors from")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBEDDING_DIM", "768")))
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore", type=int, help="candidates re-scored at full precision")
+    parser.add_argument("--quantizations", nargs="+", choices=QUANTIZATIONS, default=QUANTIZATIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results_quantization.json")
+    args = parser.parse_args()
+
+    # settings are read at import time
+    if args.rescore:
+        os.environ["RESCORE_CANDIDATES"] = str(args.rescore)
+    if args.postgres:
+        report = {"postgres": bench_postgres(args)}
+    else:
+        args.quantizations = ["none"] + [q for q in args.quantizations if q != "none"]
+        report = {"local": bench_local(args)}
+    report["config"] = {k: v for k, v in vars(args).items() if k != "out"}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
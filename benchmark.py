@@ -0,0 +1,285 @@
+"""Load test for the API with local stand-ins for Gemini.
+
+Replays the questions in requests.jsonl and eval/eval_dataset.jsonl
+against /ask at a fixed concurrency and times /upload-pdf ingestion of the
+sample PDF. By default the app runs in-process with the fake embedder, the
+fake LLM and a throwaway local vector store; --store postgres uses the
+configured database instead, and --url points at a running server.
+
+    python benchmark.py --requests 500 --concurrency 32 --out bench.json
+    python benchmark.py --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+QUESTION_FILES = ["requests.jsonl", "eval/eval_dataset.jsonl"]
+SAMPLE_PDF = "temp_sample_medical_insurance.pdf"
+
+
+def configure_offline(args) -> None:
+    """Must run before the app modules are imported: they read their
+    settings from the environment at import time."""
+    defaults = {
+        "EMBEDDER": "fake",
+        "LLM": "fake",
+        "FAKE_EMBED_DELAY": str(args.embed_delay),
+        "FAKE_LLM_DELAY": str(args.llm_delay),
+        "FAKE_LLM_TOKENS": str(args.llm_tokens),
+        "VECTOR_BACKEND": "local" if args.store == "local" else "postgres",
+        "ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "LANGSMITH_TRACING": "false",
+        "LANGCHAIN_TRACING_V2": "false",
+    }
+    if args.store == "local":
+        defaults["LOCAL_STORE_DIR"] = tempfile.mkdtemp(prefix="bench_index_")
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def load_questions(paths):
+    questions = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"WARNING: {path} not found, skipping")
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = (record.get("question") or record.get("title") or "").strip()
+                if text:
+                    questions.append(text)
+    return questions
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[rank], 4)
+
+
+def stage_totals(metrics_text):
+    """{stage: [seconds, count]} from the rag_stage_latency_seconds histogram."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    totals = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "rag_stage_latency_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0])[1] = int(sample.value)
+    return totals
+
+
+def stage_breakdown(before, after):
+    breakdown = {}
+    for stage, (seconds, count) in after.items():
+        prev_seconds, prev_count = before.get(stage, [0.0, 0])
+        n = count - prev_count
+        if n > 0:
+            breakdown[stage] = {
+                "count": n,
+                "total_s": round(seconds - prev_seconds, 4),
+                "mean_ms": round((seconds - prev_seconds) / n * 1000, 3),
+            }
+    return breakdown
+
+
+async def scrape_stages(client):
+    resp = await client.get("/metrics")
+    return stage_totals(resp.text) if resp.status_code == 200 else {}
+
+
+async def run_ingest(client, pdf_path, runs, poll_interval=0.05):
+    results = []
+    for _ in range(runs):
+        with open(pdf_path, "rb") as f:
+            resp = await client.post("/upload-pdf", files={"file": (os.path.basename(pdf_path), f, "application/pdf")})
+        resp.raise_for_status()
+        job_id = resp.json()["job_id"]
+        while True:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(poll_interval)
+        results.append(job)
+    ok = [j for j in results if j["status"] == "done"]
+    elapsed = sum(j["elapsed"] for j in ok)
+    pages = sum(j["pages"] for j in ok)
+    chunks = sum(j["chunks"] for j in ok)
+    return {
+        "runs": runs,
+        "failed": len(results) - len(ok),
+        "errors": [j["error"] for j in results if j["error"]],
+        "pages": pages,
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "chunks_per_sec": round(chunks / elapsed, 2) if elapsed else None,
+    }
+
+
+async def run_ask(client, questions, total, concurrency, mode=None):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(questions[i % len(questions)])
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"question": question}
+            if mode:
+                payload["mode"] = mode
+            start = time.perf_counter()
+            try:
+                resp = await client.post("/ask", json=payload)
+                if resp.status_code != 200:
+                    errors += 1
+                    continue
+            except Exception as e:
+                print("ERROR:", e)
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "requests_per_sec": round(len(latencies) / wall, 2) if wall else None,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 4) if latencies else None,
+        },
+    }
+
+
+def app_client(args):
+    """(http client, lifespan context) for either a remote server or the
+    app itself over ASGI."""
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url, timeout=timeout), nullcontext()
+    from rag_api import app
+
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout), app.router.lifespan_context(app)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+async def run(args):
+    questions = load_questions(args.questions)
+    if not questions:
+        sys.exit("no questions found")
+    client, lifespan = app_client(args)
+    async with lifespan, client:
+        report = {"ingest": None, "ask": None}
+        if args.ingest_runs:
+            before = await scrape_stages(client)
+            report["ingest"] = await run_ingest(client, args.pdf, args.ingest_runs)
+            report["ingest"]["stages"] = stage_breakdown(before, await scrape_stages(client))
+        if args.warmup:
+            await run_ask(client, questions, args.warmup, args.concurrency, args.mode)
+        before = await scrape_stages(client)
+        report["ask"] = await run_ask(client, questions, args.requests, args.concurrency, args.mode)
+        report["ask"]["stages"] = stage_breakdown(before, await scrape_stages(client))
+    return report
+
+
+def compare(current, baseline):
+    def get(report, *path):
+        for key in path:
+            report = (report or {}).get(key)
+        return report
+
+    rows = [
+        ("ask p50 (s)", ("ask", "latency_s", "p50")),
+        ("ask p95 (s)", ("ask", "latency_s", "p95")),
+        ("ask p99 (s)", ("ask", "latency_s", "p99")),
+        ("ask req/s", ("ask", "requests_per_sec")),
+        ("ingest pages/s", ("ingest", "pages_per_sec")),
+        ("ingest chunks/s", ("ingest", "chunks_per_sec")),
+    ]
+    print(f"\ncompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for label, path in rows:
+        new, old = get(current, *path), get(baseline, *path)
+        if new is None or old is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {label:<16} {old:>10} -> {new:<10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--questions", nargs="+", default=QUESTION_FILES)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10, help="untimed /ask requests first")
+    parser.add_argument("--mode", choices=["vector", "hybrid"])
+    parser.add_argument("--pdf", default=SAMPLE_PDF)
+    parser.add_argument("--ingest-runs", type=int, default=3)
+    parser.add_argument("--store", choices=["local", "postgres"], default="local")
+    parser.add_argument("--embed-delay", type=float, default=0.02, help="fake embedder seconds per batch")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="fake LLM seconds per answer")
+    parser.add_argument("--llm-tokens", type=int, default=64, help="fake LLM answer length")
+    parser.add_argument("--answer-cache", action="store_true", help="turn the semantic answer cache on")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    if not args.url:
+        configure_offline(args)
+    report = asyncio.run(run(args))
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        **report,
+    }
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
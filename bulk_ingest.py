@@ -0,0 +1,323 @@
+"""Ingest many PDFs (or ZIPs of PDFs) at once.
+
+PDF text extraction and sentence splitting are CPU-bound, so they run in
+a process pool across all cores; the parent process only embeds and
+stores. Chunks from different files are pooled into full embedding
+batches as parsed files come back.
+
+    python bulk_ingest.py policies/*.pdf archive.zip --collection acme
+"""
+import os
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from embedder import get_embedder
+from db_pool import get_conn
+from ingest import INGEST_BATCH_SIZE, Chunk, PageCounter, _store_batch, iter_chunks, iter_source_pages
+from local_store import use_local_backend
+from metrics import INGESTED, observe_stage, stage_timer
+
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "0")) or os.cpu_count() or 1
+# the API shares one smaller pool across jobs so requests keep some cores
+BULK_API_WORKERS = int(os.getenv("BULK_API_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // 2)
+# parsed files waiting for the embedder, per worker; bounds memory
+BULK_PREFETCH = int(os.getenv("BULK_PREFETCH", "2"))
+# the API runs ingest jobs on threads, which fork does not mix well with
+BULK_START_METHOD = os.getenv("BULK_START_METHOD", "spawn")
+# archives with more members, or more uncompressed PDF bytes, are rejected
+BULK_ZIP_MAX_MEMBERS = int(os.getenv("BULK_ZIP_MAX_MEMBERS", "1000"))
+BULK_ZIP_MAX_BYTES = int(os.getenv("BULK_ZIP_MAX_BYTES", str(1 << 30)))
+ZIP_COPY_BLOCK = 1 << 20
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """The pool API bulk jobs parse on, created on first use."""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=BULK_API_WORKERS, mp_context=multiprocessing.get_context(BULK_START_METHOD),
+                )
+    return _process_pool
+
+
+def close_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def parse_document(path: str) -> dict:
+    """Runs in a worker process: every chunk of one file, plus timings."""
+    if not os.path.isfile(path):
+        # iter_source_pages would read a missing path as raw text
+        raise FileNotFoundError(f"no such file: {path}")
+    counter = PageCounter(iter_source_pages(path))
+    start = time.perf_counter()
+    chunks = list(iter_chunks(counter))
+    total = time.perf_counter() - start
+    return {"pages": counter.count, "chunks": chunks, "extract": counter.seconds, "chunk": total - counter.seconds}
+
+
+def extract_zip(path: str, workdir: str, prefix: str = "") -> List[Tuple[str, str]]:
+    """Extract the PDF members of one archive into `workdir`, keyed by their
+    name inside it. Raises ValueError, before writing anything where the
+    archive's directory already tells, when it exceeds BULK_ZIP_MAX_MEMBERS
+    members or BULK_ZIP_MAX_BYTES uncompressed bytes."""
+    name = os.path.basename(path)
+    with zipfile.ZipFile(path) as archive:
+        members = archive.infolist()
+        if len(members) > BULK_ZIP_MAX_MEMBERS:
+            raise ValueError(f"{name} has {len(members)} members, more than {BULK_ZIP_MAX_MEMBERS}")
+        pdfs = [m for m in members if not m.is_dir() and m.filename.lower().endswith(".pdf")]
+        too_large = ValueError(f"{name} expands to more than {BULK_ZIP_MAX_BYTES} bytes")
+        if sum(m.file_size for m in pdfs) > BULK_ZIP_MAX_BYTES:
+            raise too_large
+        sources, budget = [], BULK_ZIP_MAX_BYTES
+        for i, member in enumerate(pdfs):
+            # never trust member paths; only the base name is used
+            target = os.path.join(workdir, f"{prefix}{i}_{os.path.basename(member.filename)}")
+            with archive.open(member) as src, open(target, "wb") as dst:
+                # the sizes in the directory are not trusted either
+                for block in iter(lambda: src.read(ZIP_COPY_BLOCK), b""):
+                    budget -= len(block)
+                    if budget < 0:
+                        raise too_large
+                    dst.write(block)
+            sources.append((member.filename, target))
+    return sources
+
+
+def expand_sources(paths: Iterable[str], workdir: str,
+                   on_error: Optional[Callable[[str, Exception], None]] = None) -> List[Tuple[str, str]]:
+    """(document key, file path) for every PDF in `paths`. ZIP members are
+    extracted into `workdir`; directories are searched recursively. A
+    missing path or an archive that cannot be extracted is passed to
+    `on_error` and skipped, or raises if there is no `on_error`."""
+    sources = []
+    for n, path in enumerate(paths):
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(".pdf"):
+                        full = os.path.join(root, name)
+                        sources.append((os.path.relpath(full, path), full))
+            continue
+        try:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"no such file: {path}")
+            if zipfile.is_zipfile(path):
+                sources.extend(extract_zip(path, workdir, f"{n}_"))
+            else:
+                sources.append((os.path.basename(path), path))
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            if on_error is None:
+                raise
+            on_error(os.path.basename(path), e)
+    return sources
+
+
+class _Document:
+    def __init__(self, key: str, pages: int, session=None):
+        self.key = key
+        self.pages = pages
+        self.session = session
+        self.remaining = 0
+
+
+class BulkIngest:
+    """Embeds and stores chunks of parsed files in shared batches. On
+    Postgres every file goes through the document registry, as single
+    uploads do: identical files are skipped and known chunks are reused.
+    Unlike a single upload, stored batches commit as they go, so a
+    failure leaves the files finished so far in place."""
+
+    def __init__(self, collection: Optional[str] = None, batch_size: int = INGEST_BATCH_SIZE,
+                 progress: Optional[Callable[[str, dict], None]] = None, conn=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.progress = progress
+        self.conn = conn
+        self.embedder = get_embedder()
+        self.pending: List[Tuple[_Document, Chunk]] = []
+        # registry sessions awaiting finish(); they share self.conn
+        self.open: Dict[int, _Document] = {}
+        self.stats = {
+            "files": 0, "files_done": 0, "files_skipped": 0, "files_failed": 0, "errors": {},
+            "pages": 0, "chunks": 0, "chunks_embedded": 0, "chunks_stored": 0,
+            "chunks_reused": 0, "chunks_removed": 0,
+        }
+
+    def _report(self, stage: str) -> None:
+        if self.progress:
+            self.progress(stage, dict(self.stats))
+
+    def fail(self, key: str, error: Exception) -> None:
+        print("ERROR: bulk ingest of", key, "failed:", error)
+        self.stats["files_failed"] += 1
+        self.stats["errors"][key] = str(error)
+        self._report("parse")
+
+    def add(self, key: str, path: str, parsed: dict) -> None:
+        observe_stage("extract", parsed["extract"])
+        observe_stage("chunk", parsed["chunk"])
+        chunks = parsed["chunks"]
+        doc = _Document(key, parsed["pages"])
+        if self.conn is not None:
+            from registry import open_session
+
+            doc.session, match = open_session(self.conn, key, path, self.collection)
+            if match:
+                self.stats["files_skipped"] += 1
+                self.stats["files_done"] += 1
+                self._report("parse")
+                return
+            todo = doc.session.filter_new([c.text for c in chunks])
+            self.open[id(doc)] = doc
+            self.stats["chunks_reused"] += len(chunks) - len(todo)
+            chunks = [chunks[i] for i in todo]
+        self.stats["pages"] += doc.pages
+        self.stats["chunks"] += len(parsed["chunks"])
+        doc.remaining = len(chunks)
+        self.pending.extend((doc, c) for c in chunks)
+        if not chunks:
+            self._finish(doc)
+        self._report("parse")
+
+    def flush_full(self) -> None:
+        while len(self.pending) >= self.batch_size:
+            self.flush(self.batch_size)
+
+    def flush(self, size: Optional[int] = None) -> None:
+        """Embed and store the first `size` pending chunks (all if None)."""
+        batch, self.pending = self.pending[:size], (self.pending[size:] if size else [])
+        if not batch:
+            return
+        with stage_timer("embed"):
+            embeddings = self.embedder.embed_documents([c.text for _, c in batch])
+        self.stats["chunks_embedded"] += len(embeddings)
+        self._report("embed")
+        groups: Dict[int, Tuple[_Document, List[Chunk], list]] = {}
+        for (doc, chunk), emb in zip(batch, embeddings):
+            group = groups.setdefault(id(doc), (doc, [], []))
+            group[1].append(chunk)
+            group[2].append(emb)
+        with stage_timer("store"):
+            for doc, chunks, embs in groups.values():
+                self.stats["chunks_stored"] += _store_batch(
+                    chunks, embs, doc.session, self.collection, None if doc.session else doc.key,
+                )
+            if self.conn is not None:
+                self.conn.commit()
+        for doc, chunks, _ in groups.values():
+            doc.remaining -= len(chunks)
+            if doc.remaining == 0:
+                self._finish(doc)
+        self._report("store")
+
+    def _finish(self, doc: _Document) -> None:
+        if doc.session is not None:
+            from registry import RegistryConflict
+
+            self.open.pop(id(doc), None)
+            keep = {h for other in self.open.values() for h in other.session.chunk_hashes}
+            try:
+                self.stats["chunks_removed"] += doc.session.finish(doc.pages, keep)["chunks_removed"]
+            except RegistryConflict as e:
+                self.fail(doc.key, e)
+                return
+        self.stats["files_done"] += 1
+
+
+def bulk_ingest(paths: Iterable[str], collection: Optional[str] = None, workers: int = BULK_WORKERS,
+                batch_size: int = INGEST_BATCH_SIZE, progress: Optional[Callable[[str, dict], None]] = None,
+                pool: Optional[ProcessPoolExecutor] = None) -> dict:
+    """Parse every PDF in `paths` (files, directories or ZIPs) on `workers`
+    processes and embed/store the chunks in shared batches. With `pool`,
+    parsing runs there instead and `workers` only bounds how many files
+    this run has in flight. Files that cannot be parsed, and rejected
+    archives, are counted in files_failed and listed in errors. Returns
+    aggregate stats including pages_per_sec."""
+    start = time.time()
+    workdir = tempfile.mkdtemp(prefix="bulk_ingest_")
+    try:
+        with (nullcontext() if use_local_backend() else get_conn()) as conn:
+            run = BulkIngest(collection, batch_size, progress, conn)
+            sources = expand_sources(paths, workdir, run.fail)
+            workers = max(1, min(workers, len(sources) or 1))
+            run.stats["files"] = len(sources) + run.stats["files_failed"]
+            run.stats["workers"] = workers
+            context = multiprocessing.get_context(BULK_START_METHOD)
+            with (nullcontext(pool) if pool else ProcessPoolExecutor(workers, mp_context=context)) as pool:
+                queue = iter(sources)
+                running = {}
+
+                def refill():
+                    while len(running) < workers * BULK_PREFETCH:
+                        source = next(queue, None)
+                        if source is None:
+                            return
+                        running[pool.submit(parse_document, source[1])] = source
+
+                refill()
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key, path = running.pop(future)
+                        try:
+                            parsed = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            run.fail(key, e)
+                            continue
+                        try:
+                            run.add(key, path, parsed)
+                        except Exception as e:
+                            if conn is not None:
+                                conn.rollback()
+                            run.fail(key, e)
+                    # embedding or storage errors abort the whole run
+                    run.flush_full()
+                    refill()
+            run.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    stats = run.stats
+    INGESTED.labels("pages").inc(stats["pages"])
+    INGESTED.labels("chunks").inc(stats["chunks_stored"])
+    stats["elapsed"] = round(time.time() - start, 3)
+    stats["pages_per_sec"] = round(stats["pages"] / stats["elapsed"], 2) if stats["elapsed"] else None
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="PDF files, directories or ZIP archives")
+    parser.add_argument("--collection")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    stats = bulk_ingest(args.paths, args.collection, args.workers, args.batch_size)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
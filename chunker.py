@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+from typing import Iterator, List, NamedTuple
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+NLTK_DOWNLOAD = os.getenv("NLTK_DOWNLOAD", "1") == "1"
+
+# words and single punctuation marks; close enough to subword counts for
+# budgeting without shipping the model's tokenizer
+_token_re = re.compile(r"\w+|[^\w\s]")
+_word_re = re.compile(r"\S+")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    return len(_token_re.findall(text or ""))
+
+
+def _load_punkt():
+    from nltk.tokenize import PunktTokenizer
+
+    try:
+        return PunktTokenizer("english")
+    except LookupError:
+        if not NLTK_DOWNLOAD:
+            raise
+        import nltk
+
+        nltk.download("punkt_tab", quiet=True)
+        return PunktTokenizer("english")
+
+
+def get_sentence_tokenizer():
+    """Load Punkt once per process, on first use: the pretrained English
+    model when it is available (downloading it unless NLTK_DOWNLOAD=0),
+    otherwise an untrained tokenizer."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                try:
+                    _tokenizer = _load_punkt()
+                except Exception:
+                    from nltk.tokenize import PunktSentenceTokenizer
+
+                    _tokenizer = PunktSentenceTokenizer()
+    return _tokenizer
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+
+
+class TextWindow(NamedTuple):
+    text: str
+    start: int  # character offsets into the source text
+    end: int
+    tokens: int
+
+
+class TokenChunker:
+    """Packs consecutive sentences into windows of at most `max_tokens`,
+    repeating roughly `overlap_tokens` worth of trailing sentences at the
+    start of the next window. Sentences longer than the budget are split
+    on word boundaries."""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _spans(self, text: str) -> Iterator[Span]:
+        for start, end in get_sentence_tokenizer().span_tokenize(text):
+            tokens = count_tokens(text[start:end])
+            if not tokens:
+                continue
+            if tokens <= self.max_tokens:
+                yield Span(start, end, tokens)
+                continue
+            piece_start, piece_tokens, last_end = None, 0, start
+            for m in _word_re.finditer(text, start, end):
+                word_tokens = count_tokens(m.group())
+                if piece_start is not None and piece_tokens + word_tokens > self.max_tokens:
+                    yield Span(piece_start, last_end, piece_tokens)
+                    piece_start, piece_tokens = None, 0
+                if piece_start is None:
+                    piece_start = m.start()
+                piece_tokens += word_tokens
+                last_end = m.end()
+            if piece_start is not None:
+                yield Span(piece_start, last_end, piece_tokens)
+
+    def _window(self, text: str, spans: List[Span]) -> TextWindow:
+        start, end = spans[0].start, spans[-1].end
+        return TextWindow(text[start:end].strip(), start, end, sum(s.tokens for s in spans))
+
+    def split(self, text: str) -> Iterator[TextWindow]:
+        window: List[Span] = []
+        tokens = 0
+        fresh = 0  # spans in the window that were not carried over
+        for span in self._spans(text):
+            if window and tokens + span.tokens > self.max_tokens:
+                yield self._window(text, window)
+                carry: List[Span] = []
+                carry_tokens = 0
+                for prev in reversed(window):
+                    if carry_tokens + prev.tokens > self.overlap_tokens:
+                        break
+                    carry.insert(0, prev)
+                    carry_tokens += prev.tokens
+                # never let the overlap crowd out the next sentence
+                while carry and carry_tokens + span.tokens > self.max_tokens:
+                    carry_tokens -= carry.pop(0).tokens
+                window, tokens, fresh = carry, carry_tokens, 0
+            window.append(span)
+            tokens += span.tokens
+            fresh += 1
+        if window and fresh:
+            yield self._window(text, window)
+
+
+_default_chunker = None
+
+
+def get_chunker() -> TokenChunker:
+    global _default_chunker
+    if _default_chunker is None:
+        _default_chunker = TokenChunker()
+    return _default_chunker
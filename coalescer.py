@@ -0,0 +1,132 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from embedder import get_embedder
+from vector_store import amulti_search
+from db_pool import async_conn
+
+# opt-in: concurrent /ask requests share one embedding call and one search
+ASK_COALESCE = os.getenv("ASK_COALESCE", "0") == "1"
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "5"))
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "32"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects items submitted within `window_ms` (or until `max_batch`
+    are waiting) and hands them to `fn` as one list; each caller gets back
+    the result at its own position. If `fn` raises, every caller in the
+    batch sees the error."""
+
+    def __init__(self, fn: Callable[[List[T]], Awaitable[Sequence[R]]],
+                 window_ms: float = COALESCE_WINDOW_MS, max_batch: int = COALESCE_MAX_BATCH):
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # the loop keeps only weak references to tasks
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+async def _embed_many(questions: List[str]) -> List[List[float]]:
+    return await get_embedder().aembed_queries(questions)
+
+
+async def _search_many(requests: List[tuple]) -> List[List[Tuple]]:
+    # one statement per collection in the batch: the widest top_k and ANN
+    # settings win, and each caller's rows are trimmed to its own top_k
+    by_collection = {}
+    for i, r in enumerate(requests):
+        by_collection.setdefault(r[4], []).append(i)
+    results: List[List[Tuple]] = [[] for _ in requests]
+    async with async_conn() as conn:
+        for collection, members in by_collection.items():
+            group = [requests[i] for i in members]
+            top_k = max(r[1] for r in group)
+            ef_search = max((r[2] for r in group if r[2]), default=None)
+            probes = max((r[3] for r in group if r[3]), default=None)
+            grouped = await amulti_search(
+                conn, [r[0] for r in group], top_k, ef_search, probes, collection=collection,
+            )
+            for i, r, rows in zip(members, group, grouped):
+                results[i] = rows[:r[1]]
+    return results
+
+
+_embed_batcher: Optional[MicroBatcher] = None
+_search_batcher: Optional[MicroBatcher] = None
+
+
+def _batchers() -> Tuple[MicroBatcher, MicroBatcher]:
+    global _embed_batcher, _search_batcher
+    if _embed_batcher is None:
+        _embed_batcher = MicroBatcher(_embed_many)
+        _search_batcher = MicroBatcher(_search_many)
+    return _embed_batcher, _search_batcher
+
+
+async def embed_question(question: str) -> List[float]:
+    return await _batchers()[0].submit(question)
+
+
+async def search_vectors(query_embedding, top_k: int = 3, ef_search=None, probes=None,
+                         collection: Optional[str] = None) -> List[Tuple]:
+    return await _batchers()[1].submit((query_embedding, top_k, ef_search, probes, collection))
+
+
+def coalescer_stats() -> dict:
+    return {
+        "enabled": ASK_COALESCE,
+        "embed": _embed_batcher.stats() if _embed_batcher else None,
+        "search": _search_batcher.stats() if _search_batcher else None,
+    }
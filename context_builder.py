@@ -0,0 +1,106 @@
+import os
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+from chunker import count_tokens
+from metrics import TOKENS
+
+# total tokens the model may see per request, prompt and answer together
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8192"))
+# held back from the prompt so the answer always has room
+ANSWER_TOKEN_BUDGET = int(os.getenv("ANSWER_TOKEN_BUDGET", "1024"))
+CONTEXT_SEPARATOR = "\n\n"
+
+_word_re = re.compile(r"\S+")
+
+
+class ContextChunk(NamedTuple):
+    text: str
+    page: Optional[int]
+    score: Optional[float]
+    tokens: int
+
+
+class AssembledContext(NamedTuple):
+    text: str
+    chunks: List[ContextChunk]
+    tokens: int
+    dropped: int  # candidates left out as duplicates or over budget
+
+
+def _as_chunk(item) -> ContextChunk:
+    """Accepts the shapes retrieval hands around: (text, page[, score])
+    rows, LangChain-style {"page_content", "metadata"} dicts, or strings."""
+    if isinstance(item, dict):
+        meta = item.get("metadata") or {}
+        text, page, score = item.get("page_content", ""), meta.get("page"), meta.get("score")
+    elif isinstance(item, str):
+        text, page, score = item, None, None
+    else:
+        text = item[0]
+        page = item[1] if len(item) > 1 else None
+        score = item[2] if len(item) > 2 else None
+    text = (text or "").strip()
+    return ContextChunk(text, page, score, count_tokens(text))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    end, used = 0, 0
+    for m in _word_re.finditer(text):
+        tokens = count_tokens(m.group())
+        if used + tokens > max_tokens:
+            break
+        used += tokens
+        end = m.end()
+    return text[:end]
+
+
+def input_budget(*prompt_parts: str, total: int = CONTEXT_TOKEN_BUDGET,
+                 answer: int = ANSWER_TOKEN_BUDGET) -> int:
+    """Tokens left for retrieved context once the answer reserve and the
+    fixed parts of the prompt (instructions, question) are accounted for."""
+    return max(0, total - answer - sum(count_tokens(p) for p in prompt_parts))
+
+
+def assemble_context(chunks: Iterable, budget: int) -> AssembledContext:
+    """Order chunks by score (highest first; unscored chunks keep retrieval
+    order), dedupe them by text keeping the best-scored copy, and pack
+    them into `budget` tokens. Chunks that do not fit are skipped so
+    smaller ones further down can still be used; if even the best chunk
+    is too large it is truncated."""
+    candidates = [_as_chunk(c) for c in chunks]
+    ranked = sorted(candidates, key=lambda c: (c.score is None, -(c.score or 0.0)))
+    seen = set()
+    unique: List[ContextChunk] = []
+    for c in ranked:
+        key = " ".join(c.text.split()).lower()
+        if c.text and key not in seen:
+            seen.add(key)
+            unique.append(c)
+
+    sep_tokens = count_tokens(CONTEXT_SEPARATOR)
+    picked: List[ContextChunk] = []
+    used = 0
+    for c in unique:
+        cost = c.tokens + (sep_tokens if picked else 0)
+        if used + cost <= budget:
+            picked.append(c)
+            used += cost
+        elif not picked and budget > 0:
+            text = _truncate(c.text, budget)
+            if text:
+                picked.append(c._replace(text=text, tokens=count_tokens(text)))
+                used = picked[0].tokens
+    return AssembledContext(
+        CONTEXT_SEPARATOR.join(c.text for c in picked),
+        picked,
+        used,
+        len(candidates) - len(picked),
+    )
+
+
+def build_context(question: str, chunks: Iterable, instructions: str = "") -> AssembledContext:
+    assembled = assemble_context(chunks, input_budget(instructions, question))
+    TOKENS.labels("context").inc(assembled.tokens)
+    TOKENS.labels("prompt").inc(assembled.tokens + count_tokens(instructions) + count_tokens(question))
+    return assembled
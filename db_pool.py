@@ -0,0 +1,245 @@
+import os
+import asyncio
+import time
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK = os.getenv("DB_POOL_HEALTHCHECK", "1") == "1"
+DB_ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", str(DB_POOL_MAX)))
+
+
+def db_settings() -> dict:
+    return {
+        "database": os.getenv("DB_NAME", "postgres"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+    }
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Blocking wrapper around psycopg2's ThreadedConnectionPool.
+
+    psycopg2 raises as soon as the pool is exhausted; here callers wait up
+    to `timeout` seconds for a free connection and the wait is recorded."""
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 health_check=DB_POOL_HEALTHCHECK, **conn_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check = health_check
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **(conn_kwargs or db_settings()))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._borrows = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self._borrows += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if waited > 0.001:
+                self._waits += 1
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"no database connection free after {self.timeout:.1f}s")
+        try:
+            conn = self._pool.getconn()
+            if not self._healthy(conn):
+                with self._lock:
+                    self._discarded += 1
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._record_wait(time.perf_counter() - start)
+        return conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        try:
+            self._pool.putconn(conn, close=close or conn.closed)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                "borrows": self._borrows,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "wait_seconds_avg": round(self._wait_total / self._borrows, 6) if self._borrows else 0.0,
+            }
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def get_conn():
+    with get_pool().connection() as conn:
+        yield conn
+
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+def _conninfo() -> str:
+    from psycopg.conninfo import make_conninfo
+
+    settings = db_settings()
+    settings["dbname"] = settings.pop("database")
+    return make_conninfo(**{k: v for k, v in settings.items() if v is not None})
+
+
+async def get_async_pool():
+    """psycopg 3 pool for the async /ask path; opened on first use."""
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                from psycopg_pool import AsyncConnectionPool
+
+                pool = AsyncConnectionPool(
+                    _conninfo(),
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_ASYNC_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    check=AsyncConnectionPool.check_connection if DB_POOL_HEALTHCHECK else None,
+                    # never prepare: a prepared statement may switch to a
+                    # generic plan, which cannot pick a collection's
+                    # partial index without seeing the collection value
+                    kwargs={"prepare_threshold": None},
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool() -> None:
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+@asynccontextmanager
+async def async_conn():
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+def async_pool_stats() -> dict:
+    if _async_pool is None:
+        return {}
+    stats = _async_pool.get_stats()
+    return {
+        "max_size": _async_pool.max_size,
+        "size": stats.get("pool_size", 0),
+        "available": stats.get("pool_available", 0),
+        "requests": stats.get("requests_num", 0),
+        "waits": stats.get("requests_queued", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "wait_seconds_total": stats.get("requests_wait_ms", 0) / 1000,
+    }
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """FastAPI lifespan hook: open the pools on startup, close on shutdown."""
+    try:
+        get_pool()
+        await get_async_pool()
+    except Exception as e:
+        # keep the API up; requests will retry opening the pools
+        print("WARNING: database pool not opened:", e)
+    yield
+    await close_async_pool()
+    close_pool()
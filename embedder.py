@@ -0,0 +1,251 @@
+import os
+import asyncio
+import time
+import random
+import hashlib
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Optional
+
+from embedding_cache import EmbeddingCache, cache_key, get_embedding_cache
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))  # API limit per request
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+
+_RETRYABLE_ERRORS = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+}
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if type(exc).__name__ in _RETRYABLE_ERRORS:
+        return True
+    return getattr(exc, "code", None) in (429, 500, 503)
+
+
+def _batches(items: Sequence[str], size: int) -> List[List[str]]:
+    return [list(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+class Embedder:
+    """Turns texts into vectors. Subclasses implement `_embed_batch`;
+    batching, bounded concurrency and the query cache are handled here."""
+
+    model_name = ""
+    cache: Optional[EmbeddingCache] = None
+
+    def __init__(self, batch_size: int = EMBED_BATCH_SIZE, max_in_flight: int = EMBED_MAX_IN_FLIGHT):
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: Sequence[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        if not texts:
+            return []
+        batches = _batches(texts, self.batch_size)
+        if len(batches) == 1:
+            return self._embed_batch(batches[0], task_type)
+        embedded: List[List[float]] = []
+        # map() keeps results in input order; max_workers caps batches in flight
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as pool:
+            for result in pool.map(lambda b: self._embed_batch(b, task_type), batches):
+                embedded.extend(result)
+        return embedded
+
+    def embed_query(self, text: str, task_type: str = "retrieval_query") -> List[float]:
+        if self.cache is None:
+            return self._embed_batch([text], task_type)[0]
+        key = cache_key(self.model_name, task_type, text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self._embed_batch([text], task_type)[0]
+            self.cache.put(key, embedding)
+        return embedding
+
+    async def _aembed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        return await asyncio.to_thread(self._embed_batch, texts, task_type)
+
+    async def aembed_documents(self, texts: Sequence[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        if not texts:
+            return []
+        sem = asyncio.Semaphore(self.max_in_flight)
+
+        async def run(batch):
+            async with sem:
+                return await self._aembed_batch(batch, task_type)
+
+        results = await asyncio.gather(*(run(b) for b in _batches(texts, self.batch_size)))
+        return [emb for batch in results for emb in batch]
+
+    async def aembed_query(self, text: str, task_type: str = "retrieval_query") -> List[float]:
+        if self.cache is None:
+            return (await self._aembed_batch([text], task_type))[0]
+        key = cache_key(self.model_name, task_type, text)
+        embedding = self.cache.get(key, shared=False)
+        if embedding is None and self.cache.persistent is not None:
+            # shared tier does blocking I/O; keep it off the event loop
+            embedding = await asyncio.to_thread(self.cache.get, key)
+        if embedding is None:
+            embedding = (await self._aembed_batch([text], task_type))[0]
+            await asyncio.to_thread(self.cache.put, key, embedding)
+        return embedding
+
+    async def aembed_queries(self, texts: Sequence[str], task_type: str = "retrieval_query") -> List[List[float]]:
+        """Like aembed_query for several texts; cache misses go out in as
+        few batched calls as possible."""
+        if self.cache is None:
+            return await self.aembed_documents(texts, task_type)
+        keys = [cache_key(self.model_name, task_type, t) for t in texts]
+        results = [self.cache.get(k, shared=False) for k in keys]
+        if self.cache.persistent is not None:
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = await asyncio.to_thread(self.cache.get, key)
+        misses = [i for i, r in enumerate(results) if r is None]
+        if misses:
+            embedded = await self.aembed_documents([texts[i] for i in misses], task_type)
+            for i, embedding in zip(misses, embedded):
+                results[i] = embedding
+                await asyncio.to_thread(self.cache.put, keys[i], embedding)
+        return results
+
+
+class GeminiEmbedder(Embedder):
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+        max_retries: int = EMBED_MAX_RETRIES,
+        base_backoff: float = 1.0,
+        max_backoff: float = 30.0,
+    ):
+        super().__init__(batch_size, max_in_flight)
+        import google.generativeai as genai
+
+        if os.getenv("GEMINI_API_KEY"):
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._genai = genai
+        self.model_name = model
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                res = self._genai.embed_content(
+                    model=self.model_name,
+                    content=texts,
+                    task_type=task_type,
+                )
+                return res["embedding"]
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+
+    async def _aembed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                res = await self._genai.embed_content_async(
+                    model=self.model_name,
+                    content=texts,
+                    task_type=task_type,
+                )
+                return res["embedding"]
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+
+class FakeEmbedder(Embedder):
+    """Deterministic, network-free embedder for tests and throughput runs.
+    Uses hashed bag-of-words so texts sharing words land near each other."""
+
+    _token_re = re.compile(r"\w+")
+
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        delay: float = 0.0,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    ):
+        super().__init__(batch_size, max_in_flight)
+        self.model_name = f"fake-{dim}"
+        self.dim = dim
+        self.delay = delay  # simulated round-trip time per batch
+
+    def _vector(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        tokens = self._token_re.findall(text.lower()) or [text]
+        for tok in tokens:
+            h = hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest()
+            idx = int.from_bytes(h[:4], "little") % self.dim
+            vec[idx] += 1.0 if h[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.delay:
+            time.sleep(self.delay)
+        return [self._vector(t) for t in texts]
+
+    async def _aembed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return [self._vector(t) for t in texts]
+
+
+_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """Process-wide embedder; EMBEDDER=fake selects the local one."""
+    global _embedder
+    if _embedder is None:
+        if os.getenv("EMBEDDER", "gemini").lower() == "fake":
+            _embedder = FakeEmbedder(delay=float(os.getenv("FAKE_EMBED_DELAY", "0")))
+        else:
+            _embedder = GeminiEmbedder()
+        if EMBED_CACHE:
+            _embedder.cache = get_embedding_cache()
+    return _embedder
+
+
+def set_embedder(embedder: Optional[Embedder]) -> None:
+    global _embedder
+    _embedder = embedder
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    texts = [f"Sentence {i} of the sample medical insurance policy." for i in range(n)]
+    emb = FakeEmbedder(delay=float(os.getenv("FAKE_EMBED_DELAY", "0.05")))
+    start = time.time()
+    emb.embed_documents(texts)
+    elapsed = time.time() - start
+    print(f"Embedded {n} chunks in {elapsed:.2f}s ({n / elapsed:.0f} chunks/sec)")
@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+# "memory", "sqlite" (file shared by workers on one host) or "postgres"
+EMBED_CACHE_BACKEND = os.getenv("EMBED_CACHE_BACKEND", "memory").lower()
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./embedding_cache.sqlite3")
+
+_space_re = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _space_re.sub(" ", (text or "").strip().lower())
+
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+    raw = f"{model}\x1f{task_type}\x1f{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = EMBED_CACHE_SIZE, ttl: float = EMBED_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteTier:
+    def __init__(self, path: str = EMBED_CACHE_PATH, ttl: float = EMBED_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache "
+                "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        row = self._conn().execute(
+            "SELECT embedding FROM embedding_cache WHERE key = ? AND created_at > ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        return array.array("f", row[0]).tolist()
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, embedding, created_at) VALUES (?, ?, ?)",
+                (key, array.array("f", embedding).tobytes(), time.time()),
+            )
+
+
+class PostgresTier:
+    def __init__(self, ttl: float = EMBED_CACHE_TTL):
+        from db_pool import get_conn
+
+        self._get_conn = get_conn
+        self.ttl = ttl
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache "
+                "(key TEXT PRIMARY KEY, embedding REAL[] NOT NULL, created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+            conn.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT embedding FROM embedding_cache "
+                "WHERE key = %s AND created_at > now() - make_interval(secs => %s)",
+                (key, self.ttl),
+            )
+            row = cur.fetchone()
+            conn.rollback()
+        return list(row[0]) if row else None
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        with self._get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO embedding_cache (key, embedding) VALUES (%s, %s) "
+                "ON CONFLICT (key) DO UPDATE SET embedding = EXCLUDED.embedding, created_at = now()",
+                (key, list(embedding)),
+            )
+            conn.commit()
+
+
+class EmbeddingCache:
+    """In-process LRU in front of an optional shared tier."""
+
+    def __init__(self, memory: Optional[LRUCache] = None, persistent=None):
+        self.memory = memory or LRUCache()
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key: str, shared: bool = True) -> Optional[List[float]]:
+        """shared=False only consults the in-process tier (no blocking I/O)."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+        if self.persistent is not None and not shared:
+            return None
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                self._count("errors")
+                print("WARNING: embedding cache read failed:", e)
+                value = None
+            if value is not None:
+                self._count("persistent_hits")
+                self.memory.put(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, key: str, value: List[float]) -> None:
+        self.memory.put(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, value)
+            except Exception as e:
+                self._count("errors")
+                print("WARNING: embedding cache write failed:", e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "backend": type(self.persistent).__name__ if self.persistent else "memory",
+            "size": len(self.memory),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                persistent = None
+                try:
+                    if EMBED_CACHE_BACKEND == "sqlite":
+                        persistent = SQLiteTier()
+                    elif EMBED_CACHE_BACKEND == "postgres":
+                        persistent = PostgresTier()
+                except Exception as e:
+                    print("WARNING: persistent embedding cache disabled:", e)
+                _cache = EmbeddingCache(persistent=persistent)
+    return _cache
@@ -0,0 +1,153 @@
+"""One structured LLM call per example for all four eval verdicts, cached
+on disk by content so unchanged examples are never re-graded."""
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+GRADER_MODEL = os.getenv("GRADER_MODEL", "gemini-1.5-flash")
+GRADER_CACHE_DIR = os.getenv(
+    "GRADER_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".grader_cache")
+)
+GRADER_CACHE = os.getenv("GRADER_CACHE", "1") == "1"
+# bump whenever GRADER_INSTRUCTIONS or CombinedGrade change meaning, so
+# earlier verdicts are not reused
+PROMPT_VERSION = "combined-v1"
+
+VERDICTS = ("correctness", "relevance", "groundedness", "retrieval_relevance")
+
+
+class CombinedGrade(BaseModel):
+    explanation: str = Field(..., description="Brief reasoning for each of the four labels")
+    correct: bool = Field(..., description="True if the answer matches the ground truth without contradictions")
+    relevant: bool = Field(..., description="True if the answer addresses the question and helps the user")
+    grounded: bool = Field(..., description="True if every claim in the answer is supported by the FACTS")
+    retrieval_relevant: bool = Field(..., description="True if any part of the FACTS is related to the QUESTION")
+
+
+GRADER_INSTRUCTIONS = """You are a teacher grading a RAG system's answer.
+You will be given a QUESTION, the GROUND TRUTH ANSWER, the retrieved FACTS and the STUDENT ANSWER.
+Grade four things independently:
+- correct: factual accuracy vs the ground truth only. Extra correct info is OK; no conflicts.
+  True only if it fully matches without contradictions.
+- relevant: True only if the STUDENT ANSWER addresses the QUESTION and helps the user.
+- grounded: True only if all claims in the STUDENT ANSWER are supported by the FACTS (no hallucinations).
+- retrieval_relevant: True if ANY portion of the FACTS is semantically related to the QUESTION.
+  Minor off-topic content is OK.
+Explain your reasoning first, then the labels.
+"""
+
+
+@lru_cache(maxsize=1)
+def _grader_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    llm = ChatGoogleGenerativeAI(model=GRADER_MODEL, temperature=0, google_api_key=os.environ["GOOGLE_API_KEY"])
+    return llm.with_structured_output(CombinedGrade)
+
+
+def facts_text(documents) -> str:
+    return "\n\n".join(d.get("page_content", "") for d in documents or [])
+
+
+def grade_key(question: str, gold: str, answer: str, facts: str, model: str = GRADER_MODEL) -> str:
+    payload = json.dumps(
+        {"model": model, "prompt_version": PROMPT_VERSION, "question": question,
+         "gold": gold, "answer": answer, "facts": facts},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GradeCache:
+    """Content-addressed verdict store: <dir>/<key[:2]>/<key>.json."""
+
+    def __init__(self, path: str = GRADER_CACHE_DIR):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                grade = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return grade
+
+    def put(self, key: str, grade: dict) -> None:
+        target = self._file(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(grade, f)
+        os.replace(tmp, target)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = GradeCache()
+
+
+def grade(question: str, gold: str, answer: str, documents) -> dict:
+    """All four verdicts for one example, from the cache when the same
+    model, prompt version and inputs were graded before."""
+    facts = facts_text(documents)
+    key = grade_key(question, gold, answer, facts)
+    if GRADER_CACHE:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+    msg = (
+        f"QUESTION: {question}\n"
+        f"GROUND TRUTH ANSWER: {gold}\n\n"
+        f"FACTS:\n{facts}\n\n"
+        f"STUDENT ANSWER:\n{answer}"
+    )
+    result = _grader_llm().invoke([
+        {"role": "system", "content": GRADER_INSTRUCTIONS},
+        {"role": "user", "content": msg},
+    ])
+    verdict = {
+        "correctness": bool(result.correct),
+        "relevance": bool(result.relevant),
+        "groundedness": bool(result.grounded),
+        "retrieval_relevance": bool(result.retrieval_relevant),
+        "explanation": result.explanation,
+    }
+    if GRADER_CACHE:
+        _cache.put(key, verdict)
+    return verdict
+
+
+def combined_grader(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
+    """LangSmith evaluator reporting the four verdicts as separate feedback keys."""
+    verdict = grade(
+        inputs["question"],
+        reference_outputs.get("gold_answer", ""),
+        outputs.get("answer", ""),
+        outputs.get("documents"),
+    )
+    return {
+        "results": [
+            {"key": name, "score": verdict[name], "comment": verdict.get("explanation")}
+            for name in VERDICTS
+        ]
+    }
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,218 @@
+"""Local, parallel retrieval eval.
+
+Reads eval_dataset.jsonl from disk (no LangSmith), runs each question
+through the RAG graph on a worker pool, and scores the retrieved chunks
+without an LLM grader:
+
+  hit@k / MRR (reference)  first chunk containing the answer_reference text
+  hit@k / MRR (citation)   first chunk on the cited page whose text has the
+                           cited section's words
+
+--grade adds the four LLM verdicts from grader.py (one cached call each).
+
+    python eval/run_local_eval.py --workers 8 --k 5 --retrieval-only
+    python eval/run_local_eval.py --offline   # fake embedder/LLM, local store
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(HERE, "eval_dataset.jsonl")
+SAMPLE_PDF = os.path.join(os.path.dirname(HERE), "temp_sample_medical_insurance.pdf")
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "8"))
+# share of the reference's words a chunk must contain to count as a hit
+HIT_THRESHOLD = float(os.getenv("EVAL_HIT_THRESHOLD", "0.8"))
+
+_word_re = re.compile(r"\w+")
+_page_re = re.compile(r"page\s*(\d+)", re.I)
+
+
+def _words(text: str) -> set:
+    return set(_word_re.findall((text or "").lower()))
+
+
+def load_examples(path: str = DATASET_PATH) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def reference_hit(reference: str, text: str, threshold: float = HIT_THRESHOLD) -> bool:
+    ref = _words(reference)
+    return bool(ref) and len(ref & _words(text)) / len(ref) >= threshold
+
+
+def parse_citation(citation: str):
+    """'Page 1, Pre-existing Conditions' -> (1, 'Pre-existing Conditions')."""
+    citation = citation or ""
+    m = _page_re.search(citation)
+    page = int(m.group(1)) if m else None
+    label = _page_re.sub("", citation).strip(" ,;:")
+    return page, label
+
+
+def citation_hit(citation: str, doc: dict, threshold: float = HIT_THRESHOLD) -> bool:
+    page, label = parse_citation(citation)
+    if page is None and not label:
+        return False
+    doc_page = (doc.get("metadata") or {}).get("page")
+    if page is not None and doc_page is not None and doc_page != page:
+        return False
+    return not label or reference_hit(label, doc.get("page_content", ""), threshold)
+
+
+def first_hit_rank(docs: List[dict], is_hit: Callable[[dict], bool]) -> Optional[int]:
+    for rank, doc in enumerate(docs, start=1):
+        if is_hit(doc):
+            return rank
+    return None
+
+
+def summarize_ranks(ranks: List[Optional[int]], k: int) -> dict:
+    if not ranks:
+        return {"n": 0}
+    return {
+        "n": len(ranks),
+        "hit@1": round(sum(1 for r in ranks if r == 1) / len(ranks), 4),
+        f"hit@{k}": round(sum(1 for r in ranks if r is not None and r <= k) / len(ranks), 4),
+        "mrr": round(sum(1 / r for r in ranks if r) / len(ranks), 4),
+    }
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 4)
+
+
+def make_target(k: int, retrieval_only: bool):
+    if retrieval_only:
+        from rag_langgraph import retrieve
+
+        return lambda question: retrieve({"question": question, "top_k": k})
+    from rag_langgraph import runnable
+
+    return lambda question: runnable.invoke({"question": question, "top_k": k})
+
+
+def evaluate_example(example: dict, target, k: int, grade: bool = False) -> dict:
+    question = (example.get("question") or "").strip()
+    start = time.perf_counter()
+    error = None
+    try:
+        result = target(question)
+    except Exception as e:
+        result, error = {}, str(e)
+    latency = time.perf_counter() - start
+    docs = (result.get("documents") or [])[:k]
+    reference = (example.get("answer_reference") or "").strip().strip('"')
+    citation = example.get("expected_citations") or ""
+    verdict = None
+    if grade and result.get("answer"):
+        from grader import grade as grade_answer
+
+        try:
+            verdict = grade_answer(question, example.get("gold_answer") or "", result["answer"], docs)
+        except Exception as e:
+            print("ERROR: grading", example.get("id"), e)
+    return {
+        "id": example.get("id"),
+        "question": question,
+        "latency_s": round(latency, 4),
+        "retrieved": len(docs),
+        "reference_rank": first_hit_rank(docs, lambda d: reference_hit(reference, d.get("page_content", ""))) if reference else None,
+        "citation_rank": first_hit_rank(docs, lambda d: citation_hit(citation, d)) if citation else None,
+        "answer": result.get("answer"),
+        "grade": verdict,
+        "error": error or result.get("embed_error") or result.get("db_error"),
+    }
+
+
+def summarize_grades(rows: List[dict]) -> Optional[dict]:
+    from grader import VERDICTS, cache_stats
+
+    graded = [r["grade"] for r in rows if r["grade"]]
+    if not graded:
+        return None
+    summary = {name: round(sum(1 for g in graded if g[name]) / len(graded), 4) for name in VERDICTS}
+    summary.update({"graded": len(graded), "cache": cache_stats()})
+    return summary
+
+
+def run_eval(examples: List[dict], k: int = 5, workers: int = EVAL_WORKERS, retrieval_only: bool = False,
+             grade: bool = False) -> dict:
+    target = make_target(k, retrieval_only)
+    grade = grade and not retrieval_only
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        rows = list(pool.map(lambda ex: evaluate_example(ex, target, k, grade), examples))
+    wall = time.perf_counter() - start
+    latencies = [r["latency_s"] for r in rows if not r["error"]]
+    with_reference = [ex.get("answer_reference") for ex in examples]
+    with_citation = [ex.get("expected_citations") for ex in examples]
+    return {
+        "summary": {
+            "examples": len(rows),
+            "errors": sum(1 for r in rows if r["error"]),
+            "k": k,
+            "workers": workers,
+            "retrieval_only": retrieval_only,
+            "wall_s": round(wall, 3),
+            "reference": summarize_ranks([r["reference_rank"] for r, ref in zip(rows, with_reference) if ref], k),
+            "citation": summarize_ranks([r["citation_rank"] for r, cit in zip(rows, with_citation) if cit], k),
+            "latency_s": {
+                "mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "max": round(max(latencies), 4) if latencies else None,
+            },
+            "grades": summarize_grades(rows) if grade else None,
+        },
+        "examples": rows,
+    }
+
+
+def use_offline_stack(pdf_path: str) -> None:
+    """Fake embedder and LLM over a fresh local store holding `pdf_path`."""
+    os.environ.setdefault("EMBEDDER", "fake")
+    os.environ.setdefault("LLM", "fake")
+    os.environ.setdefault("VECTOR_BACKEND", "local")
+    os.environ.setdefault("LOCAL_STORE_DIR", tempfile.mkdtemp(prefix="eval_index_"))
+    from ingest import ingest_source
+
+    stats = ingest_source(pdf_path)
+    print(f"indexed {pdf_path}: {stats['pages']} pages, {stats['chunks_stored']} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    parser.add_argument("--retrieval-only", action="store_true", help="skip answer generation")
+    parser.add_argument("--grade", action="store_true", help="LLM-grade answers with the combined grader")
+    parser.add_argument("--offline", action="store_true", help="fake embedder/LLM over a local index of --pdf")
+    parser.add_argument("--pdf", default=SAMPLE_PDF)
+    parser.add_argument("--out", default="eval_results.json")
+    args = parser.parse_args()
+
+    if args.offline:
+        use_offline_stack(args.pdf)
+    report = run_eval(load_examples(args.dataset), args.k, args.workers, args.retrieval_only, args.grade)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["summary"], indent=2))
+    print(f"per-example results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
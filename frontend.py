@@ -1,6 +1,6 @@
 import streamlit as st 
 import requests
-import time 
+import json
 
 st.title("Medical Insurance Q&A Assistant")
 
@@ -8,26 +8,38 @@ user_input = st.text_area("Ask a question about your insurance plan:", "")
 if st.button("Submit"):
     if user_input.strip():
         response = requests.post(
-            "http://127.0.0.1:8003/ask",
-            json={"question": user_input}
+            "http://127.0.0.1:8003/ask/stream",
+            json={"question": user_input},
+            stream=True,
         )
         if response.status_code == 200:
-            result = response.json()
             st.write("**Answer:**")
-            with st.empty():
-                streamed_text = ""
-                for word in result.get("answer", "").split():
-                    streamed_text += word + " "
-                    st.success(streamed_text)
-                    time.sleep(0.05)
+            answer_box = st.empty()
+            streamed_text = ""
+            top_chunks = []
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "chunks":
+                        top_chunks = data.get("top_chunks", [])
+                    elif event == "token":
+                        streamed_text += data.get("text", "")
+                        answer_box.success(streamed_text)
+                    elif event == "error":
+                        st.error(f"Error: {data.get('detail', '')}")
             st.markdown("**Top Chunks (from DB):**")
             seen_chunks = set()
-            for chunk in result.get("top_chunks", []):
+            for chunk in top_chunks:
                 if isinstance(chunk, list):
-                    for inner in chunk: 
-                        if inner not in seen_chunks:
-                            st.markdown(f"-{inner}")
-                            seen_chunks.add(inner)
+                    # [text, page] rows from the search
+                    text = chunk[0]
+                    page = chunk[1] if len(chunk) > 1 else None
+                    if text not in seen_chunks:
+                        st.markdown(f"-{text}" + (f" *(p. {page})*" if page else ""))
+                        seen_chunks.add(text)
                 else:
                     if chunk not in seen_chunks:  
                         st.markdown(f"-{chunk}")
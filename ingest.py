@@ -0,0 +1,195 @@
+import os
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from PyPDF2 import PdfReader
+
+from embedder import get_embedder
+from vector_store import store_chunks
+from db_pool import get_conn
+from chunker import TokenChunker, get_chunker
+from local_store import get_local_store, use_local_backend
+from metrics import INGESTED, observe_stage, stage_timer
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: int    # 1-based page number
+    offset: int  # character span of the chunk within its page
+    end: int
+
+
+def _pages(reader: PdfReader) -> Iterator[Tuple[int, str]]:
+    for i, page in enumerate(reader.pages, start=1):
+        yield i, page.extract_text() or ""
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) one page at a time."""
+    return _pages(PdfReader(pdf_path))
+
+
+def iter_source_pages(source: str) -> Iterator[Tuple[int, str]]:
+    """A PDF path is read page by page; a string that is not an existing
+    path is treated as raw text on a single page. Raises ValueError for a
+    file that cannot be read as a PDF."""
+    if os.path.exists(source):
+        try:
+            reader = PdfReader(source)
+        except Exception as e:
+            raise ValueError(f"cannot read {os.path.basename(source)} as a PDF: {e}") from e
+        return _pages(reader)
+    return iter([(1, source)])
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], chunker: Optional[TokenChunker] = None) -> Iterator[Chunk]:
+    chunker = chunker or get_chunker()
+    for page_no, text in pages:
+        if not text.strip():
+            continue
+        for window in chunker.split(text):
+            if window.text:
+                yield Chunk(window.text, page_no, window.start, window.end)
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class PageCounter:
+    """Pass-through over (page, text) pairs that remembers how many it saw
+    and how long producing them (PDF text extraction) took."""
+
+    def __init__(self, pages: Iterable[Tuple[int, str]]):
+        self._pages = pages
+        self.count = 0
+        self.seconds = 0.0
+
+    def __iter__(self):
+        it = iter(self._pages)
+        while True:
+            start = time.perf_counter()
+            page = next(it, None)
+            self.seconds += time.perf_counter() - start
+            if page is None:
+                return
+            self.count += 1
+            yield page
+
+
+def _store_batch(batch: List[Chunk], embeddings, session=None, collection=None, document=None) -> int:
+    texts = [c.text for c in batch]
+    meta = {
+        "pages": [c.page for c in batch],
+        "offsets": [c.offset for c in batch],
+        "ends": [c.end for c in batch],
+    }
+    if session is not None:
+        return session.store(texts, embeddings, **meta)
+    meta.update(collection=collection, document=document)
+    if use_local_backend():
+        return get_local_store().add(texts, embeddings, **meta)
+    with get_conn() as conn:
+        return store_chunks(conn, texts, embeddings, **meta)
+
+
+def ingest_pages(
+    pages: Iterable[Tuple[int, str]],
+    batch_size: int = INGEST_BATCH_SIZE,
+    progress: Optional[Callable[[str, dict], None]] = None,
+    session=None,
+    collection: Optional[str] = None,
+    document: Optional[str] = None,
+) -> dict:
+    """Split, embed and store pages in bounded batches. Only one batch of
+    chunks and vectors is held in memory, and each batch is committed as
+    soon as it is embedded. With a registry `session`, chunks already in
+    the store are not re-embedded and everything commits at the end.
+    Rows are tagged with `collection` (the default one if None) and the
+    source `document`."""
+    counter = PageCounter(pages)
+    embedder = get_embedder()
+    stats = {"pages": 0, "chunks": 0, "chunks_embedded": 0, "chunks_stored": 0, "chunks_reused": 0}
+    start = time.time()
+    batches = batched(iter_chunks(counter), batch_size)
+    while True:
+        # pulling a batch runs extraction and chunking; split the time
+        # between them using the page counter's extraction clock
+        extract_before, fetch_start = counter.seconds, time.perf_counter()
+        batch = next(batches, None)
+        extract = counter.seconds - extract_before
+        observe_stage("extract", extract)
+        observe_stage("chunk", time.perf_counter() - fetch_start - extract)
+        if batch is None:
+            break
+        stats["pages"] = counter.count
+        stats["chunks"] += len(batch)
+        if session is not None:
+            todo = session.filter_new([c.text for c in batch])
+            stats["chunks_reused"] += len(batch) - len(todo)
+            batch = [batch[i] for i in todo]
+            if not batch:
+                if progress:
+                    progress("store", dict(stats))
+                continue
+        with stage_timer("embed"):
+            embeddings = embedder.embed_documents([c.text for c in batch])
+        stats["chunks_embedded"] += len(embeddings)
+        if progress:
+            progress("embed", dict(stats))
+        with stage_timer("store"):
+            stats["chunks_stored"] += _store_batch(batch, embeddings, session, collection, document)
+        if progress:
+            progress("store", dict(stats))
+    stats["pages"] = counter.count
+    INGESTED.labels("pages").inc(stats["pages"])
+    INGESTED.labels("chunks").inc(stats["chunks_stored"])
+    stats["elapsed"] = round(time.time() - start, 3)
+    return stats
+
+
+def ingest_source(source: str, batch_size: int = INGEST_BATCH_SIZE, progress=None,
+                  document: Optional[str] = None, collection: Optional[str] = None) -> dict:
+    """Ingest a file or raw text into `collection`. When `document` names
+    a file in the Postgres store, the document registry is consulted
+    first: a file whose bytes are already registered in the collection is
+    skipped, and a revised file only embeds its new chunks and drops the
+    ones it no longer has."""
+    if not document or use_local_backend() or not os.path.isfile(source):
+        return ingest_pages(
+            iter_source_pages(source), batch_size=batch_size, progress=progress,
+            collection=collection, document=document,
+        )
+    from registry import RegistryConflict, open_session
+
+    with get_conn() as conn:
+        for attempt in range(2):
+            session, match = open_session(conn, document, source, collection)
+            if match:
+                return {
+                    "pages": 0, "chunks": 0, "chunks_embedded": 0, "chunks_stored": 0, "chunks_reused": 0,
+                    "elapsed": 0.0, "skipped": True, "duplicate_of": match["doc_key"], "version": match["version"],
+                }
+            try:
+                stats = ingest_pages(iter_source_pages(source), batch_size=batch_size, progress=progress, session=session)
+            except Exception:
+                session.abort()
+                raise
+            try:
+                stats.update(session.finish(stats["pages"]))
+                break
+            except RegistryConflict as e:
+                # a second pass embeds the chunks that were removed
+                if attempt:
+                    raise
+                print("WARNING:", e, "- ingesting again")
+    stats["skipped"] = False
+    return stats
@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "500"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    filename: str
+    status: str = "queued"  # queued -> running -> done | failed
+    stage: str = ""
+    pages: int = 0
+    chunks: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_reused: int = 0
+    chunks_removed: int = 0
+    skipped: bool = False  # identical file already ingested
+    # bulk jobs only
+    files: int = 0
+    files_done: int = 0
+    files_failed: int = 0
+    pages_per_sec: Optional[float] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        end = self.finished_at or time.time()
+        data["elapsed"] = round(end - self.started_at, 3) if self.started_at else 0.0
+        return data
+
+
+class JobQueue:
+    """Runs ingestion jobs on a small thread pool so uploads never block the
+    event loop, and at most INGEST_MAX_CONCURRENCY ingests run at once."""
+
+    def __init__(self, max_workers: int = INGEST_MAX_CONCURRENCY, max_pending: int = INGEST_QUEUE_SIZE):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+
+    def submit(self, filename: str, work: Callable[[Job], None]) -> Job:
+        job = Job(id=uuid.uuid4().hex, filename=filename)
+        with self._lock:
+            if self._pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} ingestion jobs already pending")
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY_SIZE:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def _run(self, job: Job, work: Callable[[Job], None]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            work(job)
+            job.status = "done"
+        except Exception as e:
+            print("ERROR: ingestion job", job.id, "failed:", e)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.stage = ""
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
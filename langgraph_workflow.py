@@ -2,9 +2,13 @@ from langgraph.graph import StateGraph
 from langgraph.graph.message import add_messages
 from reader import embed_query
 from reader import search_similar_chunks
-from llm import stream_answer_from_chunks
+from llm import stream_answer_from_chunks, agenerate_answer_from_chunks
+from embedder import get_embedder
+import coalescer
+from metrics import timed_node
 
 
+@timed_node("retrieve")
 def retrieve_node(state):
     query = state["question"]
     query_embedding = embed_query(query)
@@ -12,6 +16,7 @@ def retrieve_node(state):
     return {"question": query, "chunks": top_chunks}
 
 
+@timed_node("prompt")
 def prompt_node(state):
    
     chunks = state["chunks"]
@@ -21,27 +26,36 @@ def prompt_node(state):
     return {"prompt": prompt}
 
 
+@timed_node("llm")
 def llm_node(state):
     response = generate_answer_from_chunks(state["prompt"])
     return {"response": response}
 
+@timed_node("embed")
 def get_query_embedding_node(state):
     print ("[DEBUG] Node: get_query_embedding_node started")
     from reader import embed_query
     question = state["question"]
     embedding = embed_query(question)
     print(f"[DEBUG] Node: get_query_embedding_node finished")
-    return{"query_embedding": embedding, 
+    # StateGraph(dict) replaces the whole state, so carry the request's
+    # search settings along
+    return{**state,
+           "query_embedding": embedding, 
            "question": question
     }
     
+@timed_node("search")
 def search_pgvector_node(state):
     from reader import search_pgvector
     print("[DEBUG] Node: search_pgvector_node started")
     
     query_embedding = state["query_embedding"]
     question = state["question"]
-    top_chunks = search_pgvector(query_embedding)
+    top_chunks = search_pgvector(
+        query_embedding, ef_search=state.get("ef_search"), probes=state.get("probes"),
+        query_text=question, mode=state.get("retrieval_mode"), collection=state.get("collection"),
+    )
    
     print(f"[DEBUG] Node: search_pgvector_node finished")
     return {
@@ -49,16 +63,58 @@ def search_pgvector_node(state):
         "question": question
     }
 
+@timed_node("llm")
 def call_llm_node(state):
     print("[DEBUG] Node: call_llm_node started")
  
     question = state["question"]
     chunks = state["top_chunks"]
-    streamed_response =""
-    for chunk in stream_answer_from_chunks(question,chunks):
-        streamed_response += chunk + " "
+    streamed_response = "".join(stream_answer_from_chunks(question, chunks))
     return {"answer": streamed_response.strip(), "top_chunks": chunks}
     print(f"[DEBUG] Node: call_llm_node finished")
+async def aembed_question(question):
+    """Query embedding, shared with concurrent requests when ASK_COALESCE is on."""
+    if coalescer.ASK_COALESCE:
+        return await coalescer.embed_question(question)
+    return await get_embedder().aembed_query(question)
+
+@timed_node("embed")
+async def aget_query_embedding_node(state):
+    question = state["question"]
+    # the answer cache lookup may already have embedded the question
+    embedding = state.get("query_embedding") or await aembed_question(question)
+    return {**state, "query_embedding": embedding, "question": question}
+
+def _coalesce_search(state):
+    # hybrid queries carry per-question text and the local store has no
+    # round trip to save, so only plain pgvector searches are batched
+    from vector_store import RETRIEVAL_MODE
+    from local_store import use_local_backend
+    mode = (state.get("retrieval_mode") or RETRIEVAL_MODE).lower()
+    return coalescer.ASK_COALESCE and mode == "vector" and not use_local_backend()
+
+@timed_node("search")
+async def asearch_pgvector_node(state):
+    from reader import asearch_pgvector
+    if _coalesce_search(state):
+        rows = await coalescer.search_vectors(
+            state["query_embedding"], ef_search=state.get("ef_search"), probes=state.get("probes"),
+            collection=state.get("collection"),
+        )
+        return {"top_chunks": [row[:2] for row in rows], "question": state["question"]}
+    top_chunks = await asearch_pgvector(
+        state["query_embedding"], ef_search=state.get("ef_search"), probes=state.get("probes"),
+        query_text=state["question"], mode=state.get("retrieval_mode"), collection=state.get("collection"),
+    )
+    return {"top_chunks": top_chunks, "question": state["question"]}
+
+@timed_node("llm")
+async def acall_llm_node(state):
+    question = state["question"]
+    chunks = state["top_chunks"]
+    answer = await agenerate_answer_from_chunks(question, chunks)
+    return {"answer": answer.strip(), "top_chunks": chunks}
+
 def build_graph():
 
     workflow = StateGraph(dict)
@@ -72,3 +128,18 @@ def build_graph():
     workflow.set_finish_point("llm")
 
     return workflow.compile()
+
+
+def build_async_graph():
+    """Same pipeline as build_graph, with coroutine nodes for `ainvoke`."""
+    workflow = StateGraph(dict)
+    workflow.add_node("embed", aget_query_embedding_node)
+    workflow.add_node("search", asearch_pgvector_node)
+    workflow.add_node("llm", acall_llm_node)
+
+    workflow.set_entry_point("embed")
+    workflow.add_edge("embed", "search")
+    workflow.add_edge("search", "llm")
+    workflow.set_finish_point("llm")
+
+    return workflow.compile()
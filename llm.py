@@ -1,25 +1,99 @@
 
 import google.generativeai as genai
 import os
+import time
+import asyncio
+from itertools import cycle, islice
+from typing import NamedTuple
 from dotenv import load_dotenv
 from langsmith import traceable 
+from context_builder import build_context
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.5-pro")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-pro")
+# LLM=fake swaps Gemini for a local stand-in (benchmarks, offline runs)
+LLM_BACKEND = os.getenv("LLM", "gemini").lower()
+FAKE_LLM_DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.05"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "64"))
+_model = None
+
+
+class _Part(NamedTuple):
+    text: str
+
+
+class FakeModel:
+    """Network-free stand-in for genai.GenerativeModel. Answers with
+    `tokens` words taken from the prompt after `delay` seconds; streamed
+    answers spread the delay over `parts` pieces."""
+
+    def __init__(self, delay: float = FAKE_LLM_DELAY, tokens: int = FAKE_LLM_TOKENS, parts: int = 8):
+        self.delay = delay
+        self.tokens = tokens
+        self.parts = parts
+
+    def _pieces(self, prompt):
+        words = list(islice(cycle(prompt.split() or ["ok"]), self.tokens))
+        step = max(1, -(-len(words) // self.parts))
+        return [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+
+    def _stream(self, prompt):
+        pieces = self._pieces(prompt)
+        for piece in pieces:
+            time.sleep(self.delay / len(pieces))
+            yield _Part(piece)
+
+    async def _astream(self, prompt):
+        pieces = self._pieces(prompt)
+        for piece in pieces:
+            await asyncio.sleep(self.delay / len(pieces))
+            yield _Part(piece)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._stream(prompt)
+        time.sleep(self.delay)
+        return _Part("".join(self._pieces(prompt)))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._astream(prompt)
+        await asyncio.sleep(self.delay)
+        return _Part("".join(self._pieces(prompt)))
+
+
+def get_model():
+    global _model
+    if _model is None:
+        _model = FakeModel() if LLM_BACKEND == "fake" else genai.GenerativeModel(LLM_MODEL)
+    return _model
+
+PROMPT_INSTRUCTIONS = "Use the following information to answer the question:"
+
 @traceable(run_type="llm", name="gemini_generate")
 def generate_answer_from_chunks(question, top_chunks):
-    context = "\n\n".join(chunk[0] for chunk in top_chunks)
-    prompt = f"Use the following information to answer the question:\n\n{top_chunks}\n\nQuestion: {question}"
-    response = model.generate_content(prompt)
+    response = get_model().generate_content(build_prompt(question, top_chunks))
+    return response.text
+
+def build_prompt(question, top_chunks):
+    context = build_context(question, top_chunks, PROMPT_INSTRUCTIONS).text
+    return f"{PROMPT_INSTRUCTIONS}\n\n{context}\n\nQuestion: {question}"
+
+async def agenerate_answer_from_chunks(question, top_chunks):
+    response = await get_model().generate_content_async(build_prompt(question, top_chunks))
     return response.text
 
 def stream_answer_from_chunks(question, top_chunks): 
-    import time 
-    context = "\n\n".join(chunk[0] for chunk in top_chunks)
-    prompt = f"Use the following information to answer the question:\n\n{context}\n\nQuestion: {question}"
-    response = model.generate_content(prompt)
-    full_text = response.text 
-    for sentence in full_text.split(" ."):
-        yield sentence.strip() + "."
-        time.sleep(0.3)
\ No newline at end of file
+    prompt = build_prompt(question, top_chunks)
+    for part in get_model().generate_content(prompt, stream=True):
+        text = getattr(part, "text", "")
+        if text:
+            yield text
+
+async def astream_answer_from_chunks(question, top_chunks):
+    response = await get_model().generate_content_async(build_prompt(question, top_chunks), stream=True)
+    async for part in response:
+        text = getattr(part, "text", "")
+        if text:
+            yield text
@@ -0,0 +1,416 @@
+import os
+import json
+import threading
+from itertools import islice
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embedder import EMBEDDING_DIM
+from rerank import MMR_CANDIDATES, MMR_ENABLED, mmr_rerank
+from vector_store import DEFAULT_COLLECTION, RESCORE_CANDIDATES, VECTOR_METRIC, VECTOR_QUANTIZATION, content_hash
+
+# postgres | local; SKIP_DB=1 also selects the local store
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "postgres").lower()
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "./local_index")
+LOCAL_SCAN_BLOCK = int(os.getenv("LOCAL_SCAN_BLOCK", "65536"))
+
+# bits set in each byte value, for Hamming distance over packed sign bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# float16/int8 codes are widened to float32 this many rows at a time, so
+# the temporary stays in cache and the dot product can use BLAS
+_DECODE_ROWS = 1024
+
+
+_ROW_DTYPE = np.dtype([("end", "<u8"), ("collection", "<i4")])
+
+
+class _View(NamedTuple):
+    """Everything search reads about the rows, swapped in as one unit."""
+    matrix: np.ndarray
+    rows: np.ndarray  # _ROW_DTYPE: end of each row's line in chunks.jsonl, collection id
+    norms: Optional[np.ndarray]
+    codes: Optional[np.ndarray]
+    code_scales: Optional[np.ndarray]  # int8 only
+
+
+def use_local_backend() -> bool:
+    return VECTOR_BACKEND == "local" or os.getenv("SKIP_DB", "0") == "1"
+
+
+class LocalVectorStore:
+    """Server-less vector store in a directory:
+
+    embeddings.f32  float32 rows, appended in place and memory-mapped
+    chunks.jsonl    one JSON object per row (text, page, offsets, hash,
+                    collection, document)
+    meta.json       dim, committed row count and collection names
+
+    meta.json is rewritten last on every append, so rows past its count
+    (from an interrupted write) are ignored and overwritten next time.
+
+    Everything else is derived from those files and cached in memory-mapped
+    sidecars, one record per row: rows.bin (where each row's line ends in
+    chunks.jsonl, and its collection), norms.f32 and, with a quantization
+    (halfvec, int8 or binary), the compact codes the first pass scans
+    before the best RESCORE_CANDIDATES are re-scored from the float32
+    rows. Opening the store only computes sidecar rows missing since the
+    last write, and chunk text is read from disk for the rows returned,
+    so open time does not grow with the corpus. The hashes add() dedupes
+    against are read on the first add().
+
+    There must be a single writer: rows are appended without any locking
+    between processes, and two processes appending at once misalign rows,
+    chunks and sidecars."""
+
+    def __init__(self, path: str = LOCAL_STORE_DIR, dim: int = EMBEDDING_DIM, metric: str = VECTOR_METRIC,
+                 quantization: str = VECTOR_QUANTIZATION):
+        self.path = path
+        self.metric = metric
+        self.quantization = quantization
+        self._lock = threading.Lock()  # serializes writers
+        # guards only the _view swap, so searches never wait on add()'s I/O
+        self._view_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_meta()
+        self.dim = meta.get("dim", dim)
+        self.count = meta.get("count", 0)
+        self._collection_names: List[str] = list(meta.get("collections", []))
+        self._collection_ids = {name: i for i, name in enumerate(self._collection_names)}
+        self._hashes: Optional[set] = None  # (collection, hash), loaded by add()
+        self._view: Optional[_View] = None
+        self._map()
+        # drop lines from an append that never reached meta.json
+        committed = int(self._view.rows["end"][-1]) if self.count else 0
+        if os.path.exists(self._chunks_path) and os.path.getsize(self._chunks_path) > committed:
+            with open(self._chunks_path, "r+b") as f:
+                f.truncate(committed)
+
+    @property
+    def _emb_path(self) -> str:
+        return os.path.join(self.path, "embeddings.f32")
+
+    @property
+    def _chunks_path(self) -> str:
+        return os.path.join(self.path, "chunks.jsonl")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self) -> None:
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "dim": self.dim, "count": self.count, "metric": self.metric,
+                "collections": self._collection_names,
+            }, f)
+        os.replace(tmp, self._meta_path)
+
+    def _collection_id(self, name: str) -> int:
+        if name not in self._collection_ids:
+            self._collection_ids[name] = len(self._collection_names)
+            self._collection_names.append(name)
+        return self._collection_ids[name]
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization != "none"
+
+    def _sidecar_rows(self, name: str, dtype, width: int = 1, limit: Optional[int] = None) -> int:
+        """Complete rows in sidecar `name`, after cutting it to at most
+        `limit` (default: the committed count) rows."""
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return 0
+        row_bytes = np.dtype(dtype).itemsize * width
+        size = os.path.getsize(path)
+        have = min(size // row_bytes, self.count if limit is None else limit)
+        if size != have * row_bytes:
+            with open(path, "r+b") as f:
+                f.truncate(have * row_bytes)
+        return have
+
+    def _open_sidecar(self, name: str, dtype, width: int = 1) -> np.ndarray:
+        shape = (self.count, width) if width > 1 else (self.count,)
+        if self.count == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def _append_sidecar(self, name: str, values: np.ndarray) -> None:
+        with open(os.path.join(self.path, name), "ab") as f:
+            f.write(np.ascontiguousarray(values).tobytes())
+
+    def _index_chunks(self, start: int) -> None:
+        """Append rows.bin records for chunks.jsonl rows `start` onwards."""
+        offset = 0
+        if start:
+            last = np.fromfile(os.path.join(self.path, "rows.bin"), dtype=_ROW_DTYPE,
+                               count=1, offset=(start - 1) * _ROW_DTYPE.itemsize)
+            offset = int(last["end"][0])
+        known = len(self._collection_names)
+        records = np.empty(self.count - start, dtype=_ROW_DTYPE)
+        with open(self._chunks_path, "rb") as f:
+            f.seek(offset)
+            for i in range(len(records)):
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    raise ValueError(f"{self._chunks_path} has fewer rows than meta.json's {self.count}")
+                offset += len(line)
+                chunk = json.loads(line)
+                records[i] = (offset, self._collection_id(chunk.get("collection") or DEFAULT_COLLECTION))
+        self._append_sidecar("rows.bin", records)
+        if len(self._collection_names) != known:
+            self._write_meta()
+
+    def _map(self) -> None:
+        """(Re)map the embedding file and the sidecars, first computing the
+        sidecar rows they lack. The new view is built aside and swapped in
+        whole, so a concurrent search sees either the old rows or the new
+        ones, never a mix."""
+        if self.count == 0:
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            matrix = np.memmap(self._emb_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        have = self._sidecar_rows("rows.bin", _ROW_DTYPE)
+        if have < self.count:
+            self._index_chunks(have)
+        rows = self._open_sidecar("rows.bin", _ROW_DTYPE)
+        norms = codes = code_scales = None
+        # quantized l2 scoring needs the norms as well
+        if self.metric == "cosine" or self.quantized:
+            for i in range(self._sidecar_rows("norms.f32", np.float32), self.count, LOCAL_SCAN_BLOCK):
+                block = np.linalg.norm(matrix[i:i + LOCAL_SCAN_BLOCK], axis=1).astype(np.float32)
+                block[block == 0] = 1.0
+                self._append_sidecar("norms.f32", block)
+            norms = self._open_sidecar("norms.f32", np.float32)
+        if self.quantized:
+            code_name, code_dtype, width = self._code_layout()
+            have = self._sidecar_rows(code_name, code_dtype, width)
+            if self.quantization == "int8":
+                have = self._sidecar_rows("scales.int8", np.float32, limit=have)
+                self._sidecar_rows(code_name, code_dtype, width, limit=have)
+            for i in range(have, self.count, LOCAL_SCAN_BLOCK):
+                block_codes, block_scales = self._quantize(matrix[i:i + LOCAL_SCAN_BLOCK])
+                self._append_sidecar(code_name, block_codes)
+                if block_scales is not None:
+                    self._append_sidecar("scales.int8", block_scales)
+            codes = self._open_sidecar(code_name, code_dtype, width)
+            if self.quantization == "int8":
+                code_scales = self._open_sidecar("scales.int8", np.float32)
+        with self._view_lock:
+            self._view = _View(matrix, rows, norms, codes, code_scales)
+
+    def _snapshot(self) -> _View:
+        with self._view_lock:
+            return self._view
+
+    def _code_layout(self) -> Tuple[str, type, int]:
+        """Sidecar name, dtype and row width of the quantized codes."""
+        if self.quantization == "halfvec":
+            return "codes.halfvec", np.float16, self.dim
+        if self.quantization == "int8":
+            return "codes.int8", np.int8, self.dim
+        if self.quantization == "binary":
+            return "codes.binary", np.uint8, (self.dim + 7) // 8
+        raise ValueError(f"quantization must be none, halfvec, int8 or binary, got {self.quantization!r}")
+
+    def _quantize(self, block: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Compact codes for float32 rows: float16, int8 with one scale per
+        row, or packed sign bits."""
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.dim)
+        if self.quantization == "halfvec":
+            return block.astype(np.float16), None
+        if self.quantization == "int8":
+            scales = np.abs(block).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(block / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(block > 0, axis=1), None
+        raise ValueError(f"quantization must be none, halfvec, int8 or binary, got {self.quantization!r}")
+
+    def _coarse_scores(self, view: _View, sel, q: np.ndarray, q_codes: np.ndarray,
+                       q_scale: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate scores for rows `sel` (a slice or row numbers) from
+        their codes alone."""
+        codes = view.codes[sel]
+        if self.quantization == "binary":
+            return -_POPCOUNT[codes ^ q_codes].sum(axis=1, dtype=np.int32).astype(np.float32)
+        target = q_codes[0].astype(np.float32) if self.quantization == "int8" else q
+        dots = np.empty(len(codes), dtype=np.float32)
+        for i in range(0, len(codes), _DECODE_ROWS):
+            dots[i:i + _DECODE_ROWS] = codes[i:i + _DECODE_ROWS].astype(np.float32) @ target
+        if self.quantization == "int8":
+            dots *= view.code_scales[sel] * q_scale[0]
+        if self.metric == "cosine":
+            return dots / view.norms[sel]
+        if self.metric == "ip":
+            return dots
+        # -|x - q|^2 up to the constant |q|^2
+        return 2 * dots - view.norms[sel] ** 2
+
+    def memory_bytes(self) -> dict:
+        """Bytes scanned per query: the full float32 rows vs the codes."""
+        view = self._snapshot()
+        full = view.matrix.size * 4
+        codes = 0 if view.codes is None else view.codes.nbytes
+        if view.code_scales is not None:
+            codes += view.code_scales.nbytes
+        return {"float32": full, "codes": codes, "quantization": self.quantization}
+
+    def _read_chunks(self, view: _View, idx: Sequence[int]) -> List[dict]:
+        ends = view.rows["end"]
+        chunks = []
+        with open(self._chunks_path, "rb") as f:
+            for i in idx:
+                start = int(ends[i - 1]) if i else 0
+                f.seek(start)
+                chunks.append(json.loads(f.read(int(ends[i]) - start)))
+        return chunks
+
+    def _known_hashes(self) -> set:
+        """(collection, hash) of every stored row; read once, by the writer."""
+        if self._hashes is None:
+            hashes = set()
+            if self.count:
+                with open(self._chunks_path, "rb") as f:
+                    for line in islice(f, self.count):
+                        chunk = json.loads(line)
+                        hashes.add((chunk.get("collection") or DEFAULT_COLLECTION, chunk["hash"]))
+            self._hashes = hashes
+        return self._hashes
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, chunks, embeddings, pages=None, offsets=None, ends=None,
+            collection: Optional[str] = None, document: Optional[str] = None) -> int:
+        """Append new chunks, skipping texts already stored in the same
+        collection. Returns the number of rows added."""
+        collection = collection or DEFAULT_COLLECTION
+        n = len(chunks)
+        pages = pages if pages is not None else [None] * n
+        offsets = offsets if offsets is not None else [None] * n
+        ends = ends if ends is not None else [None] * n
+        with self._lock:
+            known = self._known_hashes()
+            rows, vectors, seen = [], [], set()
+            for text, emb, page, offset, end in zip(chunks, embeddings, pages, offsets, ends):
+                text = (text or "").strip()
+                h = content_hash(text)
+                if not text or (collection, h) in known or h in seen:
+                    continue
+                seen.add(h)
+                rows.append({
+                    "text": text, "page": page, "offset": offset, "end": end, "hash": h,
+                    "collection": collection, "document": document,
+                })
+                vectors.append(emb)
+            if not rows:
+                return 0
+            block = np.asarray(vectors, dtype=np.float32).reshape(len(rows), self.dim)
+            with open(self._emb_path, "ab") as f:
+                f.truncate(self.count * self.dim * 4)
+                f.write(block.tobytes())
+            committed = int(self._view.rows["end"][-1]) if self.count else 0
+            with open(self._chunks_path, "ab") as f:
+                f.truncate(committed)
+                for row in rows:
+                    f.write((json.dumps(row) + "\n").encode("utf-8"))
+            self._collection_id(collection)
+            self.count += len(rows)
+            self._write_meta()
+            known.update((collection, row["hash"]) for row in rows)
+            self._map()
+            return len(rows)
+
+    def _scores(self, block: np.ndarray, q: np.ndarray, norms: Optional[np.ndarray]) -> np.ndarray:
+        if self.metric == "cosine":
+            return (block @ q) / (norms * (np.linalg.norm(q) or 1.0))
+        if self.metric == "ip":
+            return block @ q
+        return -np.linalg.norm(block - q, axis=1)
+
+    def search(self, query_embedding: Sequence[float], top_k: int = 5,
+               diversify: Optional[bool] = None, collection: Optional[str] = None) -> List[Tuple]:
+        """Brute-force scan in LOCAL_SCAN_BLOCK slices; returns the same
+        (text, page, score) rows as vector_store.search. With `collection`
+        only that collection's rows are read."""
+        view = self._snapshot()
+        matrix, norms = view.matrix, view.norms
+        if collection is None:
+            rows = None
+            n = len(matrix)
+        elif collection in self._collection_ids:
+            rows = np.flatnonzero(view.rows["collection"] == self._collection_ids[collection])
+            n = len(rows)
+        else:
+            n = 0
+        if n == 0:
+            return []
+        mmr_on = MMR_ENABLED if diversify is None else diversify
+        limit = min(n, max(MMR_CANDIDATES, top_k) if mmr_on else top_k)
+        q = np.asarray(query_embedding, dtype=np.float32)
+        quantized = view.codes is not None
+        if quantized:
+            # the codes decide which rows get an exact score
+            keep_n = min(n, max(RESCORE_CANDIDATES, limit))
+            q_codes, q_scale = self._quantize(q)
+        else:
+            keep_n = limit
+        best_idx = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, n, LOCAL_SCAN_BLOCK):
+            if rows is None:
+                idx = np.arange(start, min(start + LOCAL_SCAN_BLOCK, n))
+            else:
+                idx = rows[start:start + LOCAL_SCAN_BLOCK]
+            if quantized:
+                sel = slice(start, start + LOCAL_SCAN_BLOCK) if rows is None else idx
+                scores = self._coarse_scores(view, sel, q, q_codes, q_scale)
+            else:
+                block = matrix[start:start + LOCAL_SCAN_BLOCK] if rows is None else matrix[idx]
+                scores = self._scores(block, q, norms[idx] if norms is not None else None)
+            best_idx = np.concatenate([best_idx, idx])
+            best_scores = np.concatenate([best_scores, scores.astype(np.float32)])
+            if len(best_idx) > keep_n:
+                keep = np.argpartition(-best_scores, keep_n - 1)[:keep_n]
+                best_idx, best_scores = best_idx[keep], best_scores[keep]
+        if quantized:
+            best_idx = np.sort(best_idx)
+            best_scores = self._scores(
+                np.asarray(matrix[best_idx]), q, norms[best_idx] if self.metric == "cosine" else None,
+            ).astype(np.float32)
+            if len(best_idx) > limit:
+                keep = np.argpartition(-best_scores, limit - 1)[:limit]
+                best_idx, best_scores = best_idx[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        best_idx, best_scores = best_idx[order], best_scores[order]
+        chunks = self._read_chunks(view, best_idx)
+        if mmr_on:
+            rows = [
+                (c["text"], c["page"], float(s), np.asarray(matrix[i]))
+                for c, i, s in zip(chunks, best_idx, best_scores)
+            ]
+            return mmr_rerank(rows, top_k)
+        return [(c["text"], c["page"], float(s)) for c, s in zip(chunks, best_scores)]
+
+
+_store: Optional[LocalVectorStore] = None
+_store_lock = threading.Lock()
+
+
+def get_local_store() -> LocalVectorStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LocalVectorStore()
+    return _store
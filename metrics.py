@@ -0,0 +1,87 @@
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# sub-second buckets for embed/search, long tail for LLM calls and ingestion
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_LATENCY = Histogram(
+    "rag_stage_latency_seconds", "Time spent per pipeline stage", ["stage"], buckets=_LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Pipeline stage failures", ["stage"])
+REQUEST_LATENCY = Histogram(
+    "rag_request_latency_seconds", "End-to-end API latency", ["endpoint"], buckets=_LATENCY_BUCKETS,
+)
+RETRIEVED_CHUNKS = Histogram(
+    "rag_retrieved_chunks", "Chunks returned by retrieval", buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50),
+)
+TOKENS = Counter("rag_tokens_total", "Approximate tokens processed", ["kind"])
+INGESTED = Counter("rag_ingested_total", "Ingested pages and chunks", ["kind"])
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def _record_result(stage: str, result) -> None:
+    if not isinstance(result, dict):
+        return
+    # some nodes report failures in the state instead of raising
+    if any(k.endswith("_error") for k in result):
+        STAGE_ERRORS.labels(stage).inc()
+    for key in ("top_chunks", "documents"):
+        if key in result:
+            RETRIEVED_CHUNKS.observe(len(result[key] or []))
+            break
+    if result.get("answer"):
+        from chunker import count_tokens
+
+        TOKENS.labels("answer").inc(count_tokens(result["answer"]))
+
+
+def timed_node(stage: str):
+    """Decorator for LangGraph nodes (sync or async): records latency and
+    errors under `stage`, plus chunk and answer-token counts from the
+    returned state. The node's signature is preserved, so nodes that take
+    a `config` argument still receive it."""
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    result = await fn(*args, **kwargs)
+                _record_result(stage, result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                result = fn(*args, **kwargs)
+            _record_result(stage, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
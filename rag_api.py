@@ -1,65 +1,350 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File 
-from pydantic import BaseModel 
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 import time 
-import psycopg2 
+import asyncio
+import json
+import uuid
 import os 
 from dotenv import load_dotenv
 import google.generativeai as genai
 import shutil 
-from rag_langgraph import runnable 
-from langgraph_workflow import build_graph
+from contextlib import asynccontextmanager, nullcontext
+from functools import lru_cache
+from rag_langgraph import ingest_file, get_runnable
+from concurrent.futures.process import BrokenProcessPool
+from bulk_ingest import BULK_API_WORKERS, bulk_ingest, close_process_pool, get_process_pool
+from langgraph_workflow import build_async_graph, aembed_question, aget_query_embedding_node, asearch_pgvector_node
+from llm import astream_answer_from_chunks, get_model
+from chunker import get_sentence_tokenizer
+from local_store import get_local_store, use_local_backend
+from embedding_cache import get_embedding_cache
+from embedder import get_embedder
+from answer_cache import ANSWER_CACHE, get_answer_cache, aingest_version, reset_ingest_version
 from langsmith import Client
 from langsmith.run_helpers import trace 
+from jobs import Job, QueueFull, get_job_queue
+import coalescer
+from metrics import REQUEST_LATENCY, TOKENS, observe_stage, render_metrics
+from chunker import count_tokens
+from db_pool import get_conn, get_pool, async_conn, async_pool_stats, lifespan as db_lifespan
+from vector_store import RETRIEVAL_MODE, ensure_schema
 
-app = FastAPI()
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-GRAPH = build_graph()
+ASK_MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", "256"))
+_ask_slots = asyncio.Semaphore(ASK_MAX_CONCURRENCY)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+_warmup = {"done": False, "seconds": None, "errors": {}}
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    return build_async_graph()
+
+
+def migrate_schema():
+    # /ask reads columns that older deployments only get from ensure_schema
+    with get_conn() as conn:
+        ensure_schema(conn)
+
+
+def warm_up():
+    """Build everything the first request would otherwise pay for."""
+    start = time.time()
+    steps = {} if use_local_backend() else {"schema": migrate_schema}
+    steps.update({
+        "embedder": get_embedder,
+        "tokenizer": get_sentence_tokenizer,
+        "graph": get_graph,
+        "ingest_graph": get_runnable,
+        "llm": get_model,
+    })
+    if use_local_backend():
+        steps["local_store"] = get_local_store
+    for name, step in steps.items():
+        try:
+            step()
+        except Exception as e:
+            print(f"WARNING: warm-up step {name} failed:", e)
+            _warmup["errors"][name] = str(e)
+    _warmup["seconds"] = round(time.time() - start, 3)
+    _warmup["done"] = True
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # the local store has no database pools to open
+    async with (nullcontext() if use_local_backend() else db_lifespan(app)):
+        if WARMUP:
+            await asyncio.to_thread(warm_up)
+        else:
+            _warmup["done"] = True
+        yield
+        get_job_queue().shutdown()
+        close_process_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
-def get_connection():
-    return psycopg2.connect(
-        database ="postgres",
-        user="postgres",
-        password=os.getenv("DB_PASSWORD"),
-        host="localhost",
-        port="5432"
-    )
 class Query(BaseModel):
     question:str
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW search breadth for this request
+    probes: Optional[int] = Field(None, ge=1, le=32768)    # IVFFlat lists probed for this request
+    mode: Optional[Literal["vector", "hybrid"]] = None  # defaults to RETRIEVAL_MODE
+    collection: Optional[str] = None  # search one collection; None searches all
+
+    def graph_input(self):
+        state = {"question": self.question}
+        if self.ef_search:
+            state["ef_search"] = self.ef_search
+        if self.probes:
+            state["probes"] = self.probes
+        if self.mode:
+            state["retrieval_mode"] = self.mode
+        if self.collection:
+            state["collection"] = self.collection
+        return state
+
+    def cache_scope(self):
+        # cached answers only serve requests that retrieve the same way
+        return json.dumps([self.collection, (self.mode or RETRIEVAL_MODE).lower(), self.ef_search, self.probes])
+
+async def lookup_cached_answer(question, scope=None):
+    """Returns (hit, cache_key) where cache_key is what store_cached_answer needs."""
+    if not ANSWER_CACHE:
+        return None, None
+    q_emb = await aembed_question(question)
+    version = await aingest_version()
+    return get_answer_cache().lookup(q_emb, version, scope), (q_emb, version, scope)
+
+def graph_input(query, cache_key):
+    state = query.graph_input()
+    if cache_key:
+        # reuse the lookup's embedding instead of embedding again
+        state["query_embedding"] = cache_key[0]
+    return state
+
+def store_cached_answer(cache_key, answer, top_chunks):
+    if cache_key and answer:
+        q_emb, version, scope = cache_key
+        get_answer_cache().store(q_emb, version, answer, top_chunks, scope)
 
 @app.post("/ask")
-def ask_question(query: Query):
+async def ask_question(query: Query):
     with trace("RAG Ask") as run:
         run.add_inputs({"question": query.question})
         start = time.time()
-        result = GRAPH.invoke({"question": query.question})
+        async with _ask_slots:
+            cached, cache_key = await lookup_cached_answer(query.question, query.cache_scope())
+            if cached:
+                result = cached
+            else:
+                result = await get_graph().ainvoke(graph_input(query, cache_key))
         answer = result.get("answer") or result.get("response") or ""
+        if not cached:
+            store_cached_answer(cache_key, answer, result.get("top_chunks", []))
 
         run.add_outputs({
             "answer": answer, 
             "top_chunks": result.get("top_chunks", [])
         })
+        REQUEST_LATENCY.labels("/ask").observe(time.time() - start)
         print(f"[DEBUG] /ask route finished in {time.time() - start:.2f}s")
         return {
             "answer": answer, 
-            "top_chunks": result.get("top_chunks", [])
+            "top_chunks": result.get("top_chunks", []),
+            "cached": bool(cached),
         }
 
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
-@app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+@app.post("/ask/stream")
+async def ask_question_stream(query: Query):
+    """Server-Sent Events: one `chunks` event with the retrieved context,
+    then a `token` event per model chunk as it arrives, then `done`."""
+    async def events():
+        start = time.time()
+        async with _ask_slots:
+            try:
+                cached, cache_key = await lookup_cached_answer(query.question, query.cache_scope())
+                if cached:
+                    yield _sse("chunks", {"top_chunks": cached["top_chunks"]})
+                    yield _sse("token", {"text": cached["answer"]})
+                    yield _sse("done", {"elapsed": round(time.time() - start, 3), "cached": True})
+                    return
+                state = graph_input(query, cache_key)
+                state.update(await aget_query_embedding_node(state))
+                state.update(await asearch_pgvector_node(state))
+                top_chunks = state.get("top_chunks", [])
+                yield _sse("chunks", {"top_chunks": top_chunks})
+                answer = ""
+                llm_start = time.time()
+                async for token in astream_answer_from_chunks(query.question, top_chunks):
+                    answer += token
+                    yield _sse("token", {"text": token})
+                observe_stage("llm", time.time() - llm_start)
+                TOKENS.labels("answer").inc(count_tokens(answer))
+                store_cached_answer(cache_key, answer.strip(), top_chunks)
+                REQUEST_LATENCY.labels("/ask/stream").observe(time.time() - start)
+                yield _sse("done", {"elapsed": round(time.time() - start, 3), "cached": False})
+            except Exception as e:
+                print("ERROR:", e)
+                yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+
+def run_ingest_job(job: Job, path: str, document: Optional[str] = None, collection: Optional[str] = None):
+    def progress(stage, stats):
+        job.stage = stage
+        job.pages = stats["pages"]
+        job.chunks = stats["chunks"]
+        job.chunks_embedded = stats["chunks_embedded"]
+        job.chunks_stored = stats["chunks_stored"]
+        job.chunks_reused = stats.get("chunks_reused", 0)
+        job.chunks_removed = stats.get("chunks_removed", 0)
+        job.skipped = stats.get("skipped", False)
+
+    try:
+        result = ingest_file(path, progress, document=document, collection=collection)
+        progress("done", result.get("ingest_stats") or {
+            "pages": 0, "chunks": 0, "chunks_embedded": 0, "chunks_stored": 0})
+        get_answer_cache().invalidate()
+        reset_ingest_version()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@app.post("/upload-pdf", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), collection: Optional[str] = Form(None)):
+    temp_file_path = f"./temp_{uuid.uuid4().hex[:8]}_{os.path.basename(file.filename or 'upload.pdf')}"
     try:
-        temp_file_path = f"./temp_{file.filename}"
         with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        result = runnable.invoke({"text": temp_file_path})
-        return {
-            "message": "PDF processed and stored in database successfully",
-            "result": result
-        }
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+        job = get_job_queue().submit(file.filename, lambda j: run_ingest_job(j, temp_file_path, file.filename, collection))
+    except QueueFull as e:
+        os.remove(temp_file_path)
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        print("ERROR:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "message": "PDF accepted for processing",
+        "job_id": job.id,
+        "status": job.status,
+    }
+
+
+def run_bulk_job(job: Job, workdir: str, paths: List[str], collection: Optional[str] = None):
+    def progress(stage, stats):
+        job.stage = stage
+        for key in ("files", "files_done", "files_failed", "pages", "chunks", "chunks_embedded",
+                    "chunks_stored", "chunks_reused", "chunks_removed"):
+            setattr(job, key, stats[key])
+
+    try:
+        stats = bulk_ingest(paths, collection, BULK_API_WORKERS, progress=progress, pool=get_process_pool())
+        progress("done", stats)
+        job.pages_per_sec = stats["pages_per_sec"]
+        if stats["errors"]:
+            job.error = "; ".join(f"{key}: {err}" for key, err in stats["errors"].items())
+        get_answer_cache().invalidate()
+        reset_ingest_version()
+    except BrokenProcessPool:
+        # a parser process died (e.g. out of memory); start the next job on a new pool
+        close_process_pool()
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@app.post("/upload-bulk", status_code=202)
+async def upload_bulk(files: List[UploadFile] = File(...), collection: Optional[str] = Form(None)):
+    """Many PDFs and/or ZIPs of PDFs as one job, parsed on a process pool."""
+    workdir = f"./temp_bulk_{uuid.uuid4().hex[:8]}"
+    os.makedirs(workdir)
+    paths = []
+    try:
+        for i, file in enumerate(files):
+            # one directory per upload keeps the file name, which is the
+            # document's registry key, even when two uploads share it
+            os.makedirs(os.path.join(workdir, str(i)))
+            path = os.path.join(workdir, str(i), os.path.basename(file.filename or "upload.pdf"))
+            with open(path, "wb") as buffer:
+                await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+            paths.append(path)
+        job = get_job_queue().submit(f"{len(files)} files", lambda j: run_bulk_job(j, workdir, paths, collection))
+    except QueueFull as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         print("ERROR:", e)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "message": f"{len(files)} files accepted for processing",
+        "job_id": job.id,
+        "status": job.status,
+    }
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/db/pool")
+def pool_stats():
+    return {"sync": get_pool().stats(), "async": async_pool_stats()}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"embedding": get_embedding_cache().stats(), "answer": get_answer_cache().stats()}
+
+
+@app.get("/coalescer/stats")
+def coalescer_stats():
+    return coalescer.coalescer_stats()
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once warm-up has run and the vector store
+    answers; 503 before that."""
+    checks = {"warmup": _warmup["done"] and not _warmup["errors"]}
+    if not use_local_backend():
+        try:
+            async with async_conn() as conn:
+                await conn.execute("SELECT 1")
+            checks["database"] = True
+        except Exception as e:
+            checks["database"] = False
+            checks["database_error"] = str(e)
+    ok = checks["warmup"] and checks.get("database", True)
+    body = {"ready": ok, "checks": checks, "warmup_seconds": _warmup["seconds"], "warmup_errors": _warmup["errors"]}
+    if not ok:
+        raise HTTPException(status_code=503, detail=body)
+    return body
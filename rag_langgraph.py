@@ -1,18 +1,21 @@
-from langgraph.graph import StateGraph, END 
-from typing import TypedDict, Annotated, List, Dict, Any, Literal, Optional 
-from langchain_core.runnables import Runnable
+from langgraph.graph import StateGraph, END, START
+from functools import lru_cache
+from typing import TypedDict, List, Dict, Any, Literal, Optional 
+from langchain_core.runnables import RunnableConfig
 import os 
 from dotenv import load_dotenv
-import psycopg2
-from PyPDF2 import PdfReader
-import nltk 
-from nltk.tokenize import PunktSentenceTokenizer
 import google.generativeai as genai 
 from psycopg2 import OperationalError
+from embedder import get_embedder
+from vector_store import search as vector_search
+from db_pool import get_conn
+from ingest import ingest_source
+from context_builder import build_context
+from metrics import stage_timer, timed_node
+from local_store import get_local_store, use_local_backend
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-nltk.download("punkt", quiet=True)
 class RAGState(TypedDict, total= False):
     text:str
     chunks: List[str]
@@ -21,55 +24,26 @@ class RAGState(TypedDict, total= False):
     question: str 
     answer: str 
     documents: List[Dict[str, Any]]
-def extract_text_from_pdf(state: RAGState) -> RAGState:
-    pdf_path = state.get("text")
-    if not pdf_path:
-        return {"text":""} 
-    try: 
-        reader = PdfReader(pdf_path)
-        raw = "".join(page.extract_text() or "" for page in reader.pages)
-        return {"text": raw}
-    except Exception: 
-        return {"text": pdf_path}
-def chunk_text(state: RAGState) -> RAGState:
-    raw = state.get("text") or ""
-    if not raw.strip():
-        return {"chunks": []}
-    pst = PunktSentenceTokenizer()
-    sentences = pst.tokenize(raw)
-    return {"chunks": sentences}
-def embed_chunks(state: RAGState) -> RAGState:
-    embedded =[]
-    chunks = state.get("chunks") or []
-    for ch in chunks:
-        res = genai.embed_content(
-            model="models/embedding-001",
-            content=ch,
-            task_type="retrieval_document"
-        )
-        embedded.append(res["embedding"])
-    return {"embeddings": embedded}
-def store_to_db(state:RAGState) -> RAGState:
-    chunks = state.get("chunks") or []
-    embs = state.get("embeddings") or []
-    if not chunks or not embs: 
-        return {}
-    conn = psycopg2.connect(
-      database="postgres",
-        user="postgres",
-        password=os.getenv("DB_PASSWORD"),
-        host="127.0.0.1",
-        port="5432"  
+    pages: int
+    stored: int
+    ingest_stats: Dict[str, Any]
+    ef_search: int
+    probes: int
+    retrieval_mode: str
+    top_k: int
+    document: str  # registry key for the file in `text`
+    collection: str  # scope for ingest and retrieval; None means all
+@timed_node("ingest")
+def ingest_document(state: RAGState, config: RunnableConfig) -> RAGState:
+    """Stream a PDF (or raw text) page by page into the documents table.
+    Pass `progress` in config["configurable"] to observe each batch."""
+    source = state.get("text") or ""
+    progress = (config or {}).get("configurable", {}).get("progress")
+    stats = ingest_source(
+        source, progress=progress, document=state.get("document"), collection=state.get("collection"),
     )
-    try: 
-        cur = conn.cursor()
-        for text, emb in zip(chunks, embs):
-            cur.execute("INSERT INTO documents (text, embedding) VALUES (%s, %s::vector)", (text, emb))
-        conn.commit()
-        cur.close()
-    finally: 
-        conn.close()
-    return{}
+    return {"pages": stats["pages"], "stored": stats["chunks_stored"], "ingest_stats": stats}
+@timed_node("retrieve")
 def retrieve(state: RAGState) -> RAGState:
     """Given a question, pull top-k similar texts from pgvector.
        Safe: never crashes eval; returns empty docs on failure."""
@@ -77,63 +51,56 @@ def retrieve(state: RAGState) -> RAGState:
     if not q:
         return {"top_results": [], "documents": []}
 
+    top_k = state.get("top_k") or 5
     try:
-        q_emb = genai.embed_content(
-            model="models/embedding-001",
-            content=q,
-            task_type="retrieval_query",
-        )["embedding"]
+        with stage_timer("embed"):
+            q_emb = get_embedder().embed_query(q)
     except Exception as e:
         return {"top_results": [], "documents": [], "embed_error": str(e)}
 
-    if os.getenv("SKIP_DB", "0") == "1":
-        return {"top_results": [], "documents": []}
-
-    conn = None
-    cur = None
     try:
-        conn = psycopg2.connect(
-            database="postgres",
-            user="postgres",
-            password=os.getenv("DB_PASSWORD"),
-            host="127.0.0.1",
-            port="5432",
-        )
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT text
-            FROM documents
-            ORDER BY embedding <#> %s::vector  -- cosine distance (pgvector)
-            LIMIT %s
-            """,
-            (q_emb, 5),
-        )
-        rows = cur.fetchall() or []
+        with stage_timer("search"):
+            if use_local_backend():
+                rows = get_local_store().search(q_emb, top_k=top_k, collection=state.get("collection"))
+            else:
+                with get_conn() as conn:
+                    rows = vector_search(
+                        conn, q_emb, top_k=top_k,
+                        ef_search=state.get("ef_search"), probes=state.get("probes"),
+                        query_text=q, mode=state.get("retrieval_mode"), collection=state.get("collection"),
+                    )
         docs = [r[0] for r in rows]
-        return {"top_results": docs, "documents": [{"page_content": t} for t in docs]}
+        return {
+            "top_results": docs,
+            "documents": [
+                {"page_content": t, "metadata": {"page": p, "score": score}} for t, p, score in rows
+            ],
+        }
     except OperationalError as e:
         return {"top_results": [], "documents": [], "db_error": str(e)}
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
 
 
   
+@lru_cache(maxsize=None)
+def _answer_model():
+    from llm import LLM_BACKEND, get_model
+
+    if LLM_BACKEND == "fake":
+        return get_model()
+    return genai.GenerativeModel("gemini-1.5-flash")
+
+@timed_node("llm")
 def answer_with_gemini(state: RAGState) -> RAGState:
     q = state.get("question") or ""
     docs = state.get("documents") or []
-    ctx = "\n\n".join(d.get("page_content", "") for d in docs)
-
-    prompt = (
+    instructions = (
         "You are a helpful assistant answering questions strictly from the provided context.\n"
         "If the answer is not in the context, say you don't know.\n\n"
-        f"CONTEXT:\n{ctx}\n\nQUESTION: {q}\n\nANSWER:"
     )
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    resp = model.generate_content(prompt)
+    ctx = build_context(q, docs, instructions).text
+
+    prompt = f"{instructions}CONTEXT:\n{ctx}\n\nQUESTION: {q}\n\nANSWER:"
+    resp = _answer_model().generate_content(prompt)
     ans = (getattr(resp, "text", "") or "").strip()
     return {"answer": ans}
 
@@ -148,31 +115,53 @@ def route(state: RAGState) -> Literal["index", "qa"]:
         return "index"
     return "qa"
 
-graph = StateGraph(RAGState)
-graph.add_node("extract_text", extract_text_from_pdf)
-graph.add_node("chunk", chunk_text)
-graph.add_node("embed", embed_chunks)
-graph.add_node("store", store_to_db)
+def choose_entry(state: RAGState) -> str:
+    return "ingest" if route(state) == "index" else "retrieve"
+
+def build_rag_graph():
+    graph = StateGraph(RAGState)
+    graph.add_node("ingest", ingest_document)
+
+    graph.add_node("retrieve", retrieve)
+    graph.add_node("answer", answer_with_gemini)
+
+    graph.add_conditional_edges(
+        START,
+        choose_entry,
+        {"ingest": "ingest", "retrieve": "retrieve"},
+    )
+
+    graph.add_edge("ingest", END)
+
+    graph.add_edge("retrieve", "answer")
+    graph.add_edge("answer", END)
+
+    return graph.compile()
 
-graph.add_node("retrieve", retrieve)
-graph.add_node("answer", answer_with_gemini)
 
-graph.set_entry_point("extract_text") 
-from langgraph.graph import START
-def choose_after_extract(state: RAGState) -> str:
-    return "chunk" if route(state) == "index" else "retrieve"
+@lru_cache(maxsize=None)
+def get_runnable():
+    """Compiled graph, built on first use rather than at import."""
+    return build_rag_graph()
 
-graph.add_conditional_edges(
-    "extract_text",
-    choose_after_extract,
-    {"chunk": "chunk", "retrieve": "retrieve"},
-)
 
-graph.add_edge("chunk", "embed")
-graph.add_edge("embed", "store")
-graph.add_edge("store", END)
+def __getattr__(name):
+    # keeps `from rag_langgraph import runnable` working without compiling
+    # the graph as an import side effect
+    if name == "runnable":
+        return get_runnable()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-graph.add_edge("retrieve", "answer")
-graph.add_edge("answer", END)
 
-runnable = graph.compile()
\ No newline at end of file
+def ingest_file(path: str, progress=None, document: Optional[str] = None,
+                collection: Optional[str] = None) -> RAGState:
+    """Run the index flow for one file; progress(stage, stats) is called
+    after every embedded and every stored batch. `document` (usually the
+    uploaded file name) enables registry-based incremental re-ingest, and
+    `collection` picks where the chunks go."""
+    state = {"text": path}
+    if document:
+        state["document"] = document
+    if collection:
+        state["collection"] = collection
+    return get_runnable().invoke(state, config={"configurable": {"progress": progress}})
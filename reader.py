@@ -1,136 +1,73 @@
-from pypdf import PdfReader 
-import nltk 
-nltk.download("punkt")
-from nltk.tokenize import PunktSentenceTokenizer
-import os 
-from dotenv import load_dotenv 
-import google.generativeai as genai 
-import psycopg2
-from langsmith import traceable 
+import sys
+import asyncio
+from dotenv import load_dotenv
+from langsmith import traceable
+from embedder import get_embedder
+from vector_store import store_chunks, search as vector_search, asearch as vector_asearch
+from db_pool import get_conn, async_conn
+from local_store import get_local_store, use_local_backend
 
-reader = PdfReader("/Users/richa/Downloads/sample_medical_insurance.pdf")
-number_of_pages = len(reader.pages)
-page = reader.pages[0]
-text = page.extract_text() 
+load_dotenv()
 
-pst = PunktSentenceTokenizer()
-sentences = pst.tokenize(text)
 
+def store_embeddings(data_chunks):
+    with get_conn() as conn:
+        store_chunks(
+            conn,
+            [chunk["text"] for chunk in data_chunks],
+            [chunk["embedding"] for chunk in data_chunks],
+        )
 
+def search_similar_chunks(query_embedding, top_k=3, ef_search=None, probes=None, collection=None):
+    if use_local_backend():
+        return [row[0] for row in get_local_store().search(query_embedding, top_k, collection=collection)]
+    with get_conn() as conn:
+        rows = vector_search(conn, query_embedding, top_k, ef_search, probes, collection=collection)
+    return [row[0] for row in rows]
 
-load_dotenv()
-genai.configure(api_key = os.getenv("GEMINI_API_KEY"))
-data_chunks= [] 
-for sentence in sentences: 
-    response = genai.embed_content(
-        model="models/embedding-001", 
-        content=sentence, 
-        task_type="retrieval_document"
-    )
-    embedding = response["embedding"]
-    data_chunks.append({
-        "text": sentence, 
-        "embedding": embedding
-    })
-    for i, chunk in enumerate(data_chunks[:5]):
-        print(f"[{i+1}] {chunk['text'][:60]}... → embedding length: {len(chunk['embedding'])}")
+@traceable(run_type="chain", name="embed_query")
+def embed_query(query):
+    return get_embedder().embed_query(query)
 
+@traceable(run_type="tool", name="pgvector_search")
+def search_pgvector(query_embedding, top_k=3, ef_search=None, probes=None, query_text=None, mode=None,
+                    collection=None):
+    if use_local_backend():
+        return [row[:2] for row in get_local_store().search(query_embedding, top_k, collection=collection)]
+    with get_conn() as conn:
+        rows = vector_search(conn, query_embedding, top_k, ef_search, probes, query_text, mode, collection=collection)
+    return [row[:2] for row in rows]
 
-def store_embeddings(data_chunks):
-    conn=psycopg2.connect(
-        database="postgres",
-        user="postgres",
-        password = "DB_PASSWORD",
-        host="localhost",
-        port="5432"
-    )
-    cur=conn.cursor()
-    for chunk in data_chunks:
-        cur.execute(
-                "INSERT INTO documents (text,embedding) VALUES( %s, %s::vector)",
-                (chunk["text"], chunk["embedding"])
+async def asearch_pgvector(query_embedding, top_k=3, ef_search=None, probes=None, query_text=None, mode=None,
+                           collection=None):
+    if use_local_backend():
+        rows = await asyncio.to_thread(get_local_store().search, query_embedding, top_k, collection=collection)
+        return [row[:2] for row in rows]
+    async with async_conn() as conn:
+        rows = await vector_asearch(
+            conn, query_embedding, top_k, ef_search, probes, query_text, mode, collection=collection,
         )
-    conn.commit()
-    cur.close()
-    conn.close()
+    return [row[:2] for row in rows]
+
 
-store_embeddings(data_chunks)
+if __name__ == "__main__":
+    # Manual smoke test: index the first page of a PDF, then run a few
+    # sample questions against it.
+    from ingest import iter_pdf_pages, iter_chunks
 
-def search_similar_chunks(query_embedding, top_k=3):
-    conn = psycopg2.connect(
-        database="postgres",
-        user="postgres",
-        password=os.getenv("DB_PASSWORD"),
-        host="localhost",
-        port="5432"
-    )
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT text
-        FROM documents
-        ORDER BY embedding <-> %s::vector
-        LIMIT %s
-        """,
-        (query_embedding, top_k)
-    )
-    results = [row[0] for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return results
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else "temp_sample_medical_insurance.pdf"
+    first_page = next(iter_pdf_pages(pdf_path))
+    sentences = [chunk.text for chunk in iter_chunks([first_page])]
+    embeddings = get_embedder().embed_documents(sentences)
+    data_chunks = [{"text": s, "embedding": e} for s, e in zip(sentences, embeddings)]
+    for i, chunk in enumerate(data_chunks[:5]):
+        print(f"[{i+1}] {chunk['text'][:60]}... → embedding length: {len(chunk['embedding'])}")
+    store_embeddings(data_chunks)
 
-result = genai.embed_content(
-    model = "models/embedding-001",
-    content = [
+    for question in [
         "What type of surgeries does my insurance cover?",
         "Can I perform a cosmetic surgery?",
         "When does my insurance expire?",
-        "What is my policy number?"
-    ],
-    task_type = "retrieval_query",
-)
-@traceable(run_type="chain", name="embed_query")
-def embed_query(query):
-    response = genai.embed_content(
-        model="models/embedding-001",
-        content=query,
-        task_type="retrieval_query"
-    )
-    return response["embedding"]
-
-print(result['embedding'])
-@traceable(run_type="tool", name="pgvector_search")
-def search_pgvector(query_embedding, top_k=3):
-    conn=psycopg2.connect(
-        database="postgres",
-        user="postgres",
-        password = "DB_PASSWORD",
-        host="localhost",
-        port="5432"
-    )
-    cur=conn.cursor()
-    cur.execute(
-        """
-        SELECT text
-        FROM documents
-        ORDER BY embedding <-> %s::vector
-        LIMIT %s
-        """,
-        (query_embedding, top_k * 2)
-    )
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    seen = set()
-    unique_chunks = []
-    for row in results: 
-        text = row[0].strip()
-        if text not in seen:
-            seen.add(text)
-            unique_chunks.append(text)
-        if len(unique_chunks) == top_k:
-            break 
-    return results
-query_embedding = result['embedding'][0] 
-results = search_pgvector(query_embedding)#select one query embedding and store it in variable, will use this vector in sql query 
-print(results)
\ No newline at end of file
+        "What is my policy number?",
+    ]:
+        print(question, search_pgvector(embed_query(question), query_text=question))
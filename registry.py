@@ -0,0 +1,182 @@
+import hashlib
+from typing import Iterable, List, Optional, Sequence
+
+from vector_store import (
+    BUMP_INGEST_VERSION_SQL, DEFAULT_COLLECTION, content_hash, ensure_collection, store_chunks,
+)
+
+FILE_HASH_BLOCK = 1 << 20
+
+# Serializes finish() per collection, so each stale-chunk DELETE sees every
+# chunk list registered before it and each re-check of reused chunks sees
+# every DELETE. Held only until that commit, never while embedding.
+_FINISH_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('document_registry:' || %s))"
+
+# chunks that belonged to the previous version and to no other document
+# in the same collection
+_DELETE_STALE_SQL = """
+DELETE FROM documents d
+WHERE d.collection = %(collection)s
+  AND d.content_hash = ANY(%(stale)s)
+  AND NOT EXISTS (
+      SELECT 1 FROM document_registry r
+      WHERE r.collection = %(collection)s AND r.doc_key <> %(doc_key)s
+        AND d.content_hash = ANY(r.chunk_hashes)
+  )
+"""
+
+_UPSERT_SQL = """
+INSERT INTO document_registry (collection, doc_key, file_hash, version, chunk_hashes, pages, updated_at)
+VALUES (%(collection)s, %(doc_key)s, %(file_hash)s, 1, %(chunk_hashes)s, %(pages)s, now())
+ON CONFLICT (collection, doc_key) DO UPDATE SET
+    file_hash = EXCLUDED.file_hash,
+    version = document_registry.version + 1,
+    chunk_hashes = EXCLUDED.chunk_hashes,
+    pages = EXCLUDED.pages,
+    updated_at = now()
+RETURNING version
+"""
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def find_by_hash(conn, digest: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT doc_key, version FROM document_registry WHERE collection = %s AND file_hash = %s LIMIT 1",
+            (collection, digest),
+        )
+        row = cur.fetchone()
+    return {"doc_key": row[0], "version": row[1]} if row else None
+
+
+class RegistryConflict(Exception):
+    """Chunks a session reused were deleted by a concurrent re-ingest
+    before it finished; ingesting the file again embeds them anew."""
+
+
+def lookup(conn, doc_key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT file_hash, version, chunk_hashes FROM document_registry "
+            "WHERE collection = %s AND doc_key = %s",
+            (collection, doc_key),
+        )
+        row = cur.fetchone()
+    return {"file_hash": row[0], "version": row[1], "chunk_hashes": row[2]} if row else None
+
+
+class RegistrySession:
+    """Incremental re-ingest of one document inside a single transaction.
+
+    filter_new() drops chunks whose text is already stored, so only new or
+    changed chunks get embedded; store() inserts them without committing;
+    finish() deletes chunks the previous version had and this one does
+    not, records the new chunk list, and commits everything at once.
+    Readers keep seeing the previous version until then."""
+
+    def __init__(self, conn, doc_key: str, digest: str, previous: Optional[dict] = None,
+                 collection: str = DEFAULT_COLLECTION):
+        self.conn = conn
+        self.doc_key = doc_key
+        self.collection = collection
+        self.file_hash = digest
+        self.previous = previous
+        self.chunk_hashes: List[str] = []
+        self._seen = set()
+        self._reused: List[str] = []
+        self.inserted = 0
+
+    def filter_new(self, texts: Sequence[str]) -> List[int]:
+        """Indexes of `texts` that still need embedding."""
+        hashes = [content_hash((t or "").strip()) for t in texts]
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT content_hash FROM documents WHERE collection = %s AND content_hash = ANY(%s)",
+                (self.collection, list(set(hashes))),
+            )
+            stored = {row[0] for row in cur.fetchall()}
+        todo = []
+        for i, h in enumerate(hashes):
+            if h in self._seen:
+                continue
+            self._seen.add(h)
+            self.chunk_hashes.append(h)
+            if h in stored:
+                self._reused.append(h)
+            else:
+                todo.append(i)
+        return todo
+
+    def store(self, chunks, embeddings, **meta) -> int:
+        inserted = store_chunks(
+            self.conn, chunks, embeddings, commit=False,
+            collection=self.collection, document=self.doc_key, **meta,
+        )
+        self.inserted += inserted
+        return inserted
+
+    def finish(self, pages: Optional[int] = None, keep: Iterable[str] = ()) -> dict:
+        """Commit the new version. `keep` lists chunk hashes claimed by other
+        sessions still open on this connection, which must not be deleted.
+        Raises RegistryConflict, after rolling back, if chunks this session
+        reused have been deleted since filter_new()."""
+        stale = sorted(set(self.previous["chunk_hashes"]) - self._seen - set(keep)) if self.previous else []
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(_FINISH_LOCK_SQL, (self.collection,))
+                if self._reused:
+                    cur.execute(
+                        "SELECT content_hash FROM documents WHERE collection = %s AND content_hash = ANY(%s)",
+                        (self.collection, self._reused),
+                    )
+                    lost = set(self._reused) - {row[0] for row in cur.fetchall()}
+                    if lost:
+                        raise RegistryConflict(
+                            f"{len(lost)} reused chunks of {self.doc_key} were removed by a concurrent "
+                            f"ingest into collection {self.collection}"
+                        )
+                removed = 0
+                if stale:
+                    cur.execute(_DELETE_STALE_SQL, {
+                        "stale": stale, "doc_key": self.doc_key, "collection": self.collection,
+                    })
+                    removed = max(cur.rowcount, 0)
+                cur.execute(_UPSERT_SQL, {
+                    "collection": self.collection,
+                    "doc_key": self.doc_key,
+                    "file_hash": self.file_hash,
+                    "chunk_hashes": self.chunk_hashes,
+                    "pages": pages,
+                })
+                version = cur.fetchone()[0]
+                if self.inserted or removed:
+                    cur.execute(BUMP_INGEST_VERSION_SQL)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return {"version": version, "chunks_removed": removed}
+
+    def abort(self) -> None:
+        self.conn.rollback()
+
+
+def open_session(conn, doc_key: str, path: str, collection: Optional[str] = None):
+    """(session, None) for a new or revised file, or (None, match) when a
+    file with identical bytes is already registered in the collection."""
+    collection = collection or DEFAULT_COLLECTION
+    ensure_collection(conn, collection)
+    digest = file_hash(path)
+    match = find_by_hash(conn, digest, collection)
+    if match:
+        conn.rollback()
+        return None, match
+    session = RegistrySession(conn, doc_key, digest, lookup(conn, doc_key, collection), collection)
+    return session, None
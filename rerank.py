@@ -0,0 +1,69 @@
+import os
+from typing import List, Sequence
+
+import numpy as np
+
+MMR_ENABLED = os.getenv("MMR", "1") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+
+
+def parse_vector(text: str) -> np.ndarray:
+    """pgvector's text form '[0.1,0.2,...]' -> float32 array."""
+    return np.array(text.strip("[]").split(","), dtype=np.float32)
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def mmr(relevance: Sequence[float], candidates: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """Maximal Marginal Relevance: indexes of `k` candidates, each chosen to
+    maximise lambda * relevance - (1 - lambda) * max sim(already chosen).
+    `relevance` is each candidate's retrieval score on a fixed scale, not
+    rescaled per candidate set, so weak candidates keep their real distance
+    from strong ones; embedding cosine similarity only measures redundancy."""
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    c = _normalize(np.asarray(candidates, dtype=np.float32))
+    relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = c @ c.T
+    first = int(np.argmax(relevance))
+    selected = [first]
+    available = np.ones(n, dtype=bool)
+    available[first] = False
+    redundancy = pairwise[first].copy()
+    for _ in range(min(k, n) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+def mmr_rerank(rows: Sequence[tuple], k: int, lambda_mult: float = MMR_LAMBDA,
+               score_scale: float = 1.0) -> List[tuple]:
+    """Rows are (..., score, embedding) in descending score order, the
+    embedding either in pgvector text form or as an array. The score (a
+    similarity for vector search, the RRF score for hybrid) divided by
+    `score_scale` is the relevance term, so the metric and the fusion keep
+    deciding the order; similarities are used as they are, RRF scores are
+    divided by their maximum. Exact duplicate texts are dropped, MMR picks
+    `k`, and rows come back without the embedding column."""
+    seen = set()
+    unique = []
+    for row in rows:
+        key = row[0].strip()
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    if not unique:
+        return []
+    matrix = np.stack([parse_vector(row[-1]) if isinstance(row[-1], str) else row[-1] for row in unique])
+    order = mmr([row[-2] / score_scale for row in unique], matrix, k, lambda_mult)
+    return [unique[i][:-1] for i in order]
@@ -0,0 +1,66 @@
+import pytest
+
+from chunker import TokenChunker, count_tokens
+from ingest import Chunk, iter_chunks
+
+TEXT = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+
+
+def test_count_tokens_counts_words_and_punctuation():
+    assert count_tokens("Hello, world!") == 4
+    assert count_tokens("") == 0
+    assert count_tokens(None) == 0
+
+
+def test_overlap_must_be_smaller_than_the_budget():
+    with pytest.raises(ValueError):
+        TokenChunker(max_tokens=4, overlap_tokens=4)
+
+
+def test_windows_stay_within_the_token_budget():
+    for max_tokens in (4, 8, 10, 12):
+        for window in TokenChunker(max_tokens, 1).split(TEXT):
+            assert window.tokens <= max_tokens
+            assert count_tokens(window.text) == window.tokens
+
+
+def test_whole_sentences_are_packed_together():
+    windows = list(TokenChunker(8, 3).split(TEXT))
+    assert [w.text for w in windows] == ["One two three. Four five six.", "Seven eight nine. Ten eleven twelve."]
+
+
+def test_trailing_sentences_are_repeated_as_overlap():
+    windows = list(TokenChunker(10, 4).split(TEXT))
+    assert [w.text for w in windows] == [
+        "One two three. Four five six.",
+        "Four five six. Seven eight nine.",
+        "Seven eight nine. Ten eleven twelve.",
+    ]
+
+
+def test_no_trailing_window_of_overlap_only():
+    windows = list(TokenChunker(10, 4).split("One two three. Four five six."))
+    assert [w.text for w in windows] == ["One two three. Four five six."]
+
+
+def test_long_sentences_are_split_on_word_boundaries():
+    windows = list(TokenChunker(4, 1).split("a b c d e f g h i j"))
+    assert [w.text for w in windows] == ["a b c d", "e f g h", "i j"]
+
+
+def test_window_offsets_point_into_the_source_text():
+    text = "  " + TEXT + "\n"
+    for window in TokenChunker(10, 4).split(text):
+        assert text[window.start:window.end].strip() == window.text
+
+
+def test_chunks_carry_their_page_and_offsets():
+    pages = [(1, "Hello there. General Kenobi."), (2, "   "), (3, "Bye now.")]
+    chunks = list(iter_chunks(pages, TokenChunker(4, 1)))
+    assert chunks == [
+        Chunk("Hello there.", 1, 0, 12),
+        Chunk("General Kenobi.", 1, 13, 28),
+        Chunk("Bye now.", 3, 0, 8),
+    ]
+    for chunk in chunks:
+        assert dict(pages)[chunk.page][chunk.offset:chunk.end] == chunk.text
@@ -0,0 +1,49 @@
+import asyncio
+
+from coalescer import MicroBatcher
+
+
+def _recording_batcher(**kwargs):
+    calls = []
+
+    async def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    return MicroBatcher(double, **kwargs), calls
+
+
+def test_concurrent_calls_are_merged_into_one_batch():
+    batcher, calls = _recording_batcher(window_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert batcher.stats() == {"batches": 1, "items": 5, "largest_batch": 5, "avg_batch": 5.0}
+    assert not batcher._running
+
+
+def test_a_full_batch_is_sent_without_waiting_for_the_window():
+    batcher, calls = _recording_batcher(window_ms=10_000, max_batch=2)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), 1)
+
+    assert asyncio.run(main()) == [0, 2, 4, 6]
+    assert calls == [[0, 1], [2, 3]]
+
+
+def test_every_caller_in_a_failed_batch_sees_the_error():
+    async def fail(items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(fail, window_ms=5)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [str(r) for r in results] == ["boom"] * 3
+    assert all(isinstance(r, RuntimeError) for r in results)
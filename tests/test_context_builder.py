@@ -0,0 +1,37 @@
+from context_builder import assemble_context, input_budget
+
+
+def test_duplicates_keep_the_best_scored_copy():
+    result = assemble_context([("dup text", 1, 0.2), ("other", 2, 0.5), ("Dup  text", 3, 0.9)], 100)
+    assert [(c.text, c.page, c.score) for c in result.chunks] == [("Dup  text", 3, 0.9), ("other", 2, 0.5)]
+    assert result.dropped == 1
+
+
+def test_unscored_chunks_keep_retrieval_order_after_scored_ones():
+    result = assemble_context(["first", ("scored", 1, 0.1), "second"], 100)
+    assert [c.text for c in result.chunks] == ["scored", "first", "second"]
+
+
+def test_chunks_over_budget_are_skipped_for_smaller_ones():
+    chunks = [("one two three", 1, 0.9), ("four five six seven eight", 2, 0.8), ("nine", 3, 0.7)]
+    result = assemble_context(chunks, 4)
+    assert [c.text for c in result.chunks] == ["one two three", "nine"]
+    assert result.tokens <= 4
+    assert result.dropped == 1
+    assert result.text == "one two three\n\nnine"
+
+
+def test_first_chunk_is_truncated_when_nothing_fits():
+    result = assemble_context([("one two three four five", 1, 0.9), ("six seven eight nine ten", 2, 0.8)], 3)
+    assert [c.text for c in result.chunks] == ["one two three"]
+    assert result.tokens == 3
+
+
+def test_zero_budget_yields_no_context():
+    result = assemble_context([("one", 1, 0.9)], 0)
+    assert result.chunks == [] and result.text == "" and result.dropped == 1
+
+
+def test_input_budget_reserves_the_answer_and_prompt():
+    assert input_budget("four words right here", total=100, answer=20) == 76
+    assert input_budget("x " * 50, total=40, answer=20) == 0
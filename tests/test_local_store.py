@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from local_store import LocalVectorStore
+
+DIM = 16
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(500, DIM)).astype(np.float32)
+
+
+def _store(tmp_path, quantization="none"):
+    return LocalVectorStore(str(tmp_path / "index"), dim=DIM, metric="cosine", quantization=quantization)
+
+
+def _exact_top(vectors, q, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ (q / np.linalg.norm(q))))[:k])
+
+
+def test_add_and_search_returns_the_nearest_rows(tmp_path, vectors):
+    store = _store(tmp_path)
+    assert store.add([f"t{i}" for i in range(len(vectors))], vectors, pages=list(range(len(vectors)))) == 500
+    rows = store.search(vectors[7], top_k=3, diversify=False)
+    assert rows[0][:2] == ("t7", 7)
+    assert rows[0][2] == pytest.approx(1.0)
+    assert [r[0] for r in rows] == [f"t{i}" for i in _exact_top(vectors, vectors[7], 3)]
+
+
+def test_reopen_keeps_rows_and_appends(tmp_path, vectors):
+    _store(tmp_path).add([f"t{i}" for i in range(300)], vectors[:300])
+    store = _store(tmp_path)
+    assert len(store) == 300
+    assert store.add([f"t{i}" for i in range(300, 500)], vectors[300:]) == 200
+    reopened = _store(tmp_path)
+    assert len(reopened) == 500
+    assert reopened.search(vectors[450], top_k=1, diversify=False)[0][0] == "t450"
+
+
+def test_reopen_ignores_an_interrupted_append(tmp_path, vectors):
+    store = _store(tmp_path)
+    store.add(["a", "b"], vectors[:2])
+    with open(store._chunks_path, "a") as f:
+        f.write('{"text": "torn", "hash": "x"}\n')
+    reopened = _store(tmp_path)
+    assert len(reopened) == 2
+    assert reopened.add(["c"], vectors[2:3]) == 1
+    assert _store(tmp_path).search(vectors[2], top_k=1, diversify=False)[0][0] == "c"
+
+
+def test_duplicate_texts_are_stored_once_per_collection(tmp_path, vectors):
+    store = _store(tmp_path)
+    assert store.add(["same", "same", " same "], vectors[:3]) == 1
+    assert store.add(["same"], vectors[:1]) == 0
+    assert store.add(["same"], vectors[:1], collection="other") == 1
+    assert _store(tmp_path).add(["same"], vectors[:1], collection="other") == 0
+
+
+def test_search_is_limited_to_the_collection(tmp_path, vectors):
+    store = _store(tmp_path)
+    store.add([f"a{i}" for i in range(250)], vectors[:250], collection="a")
+    store.add([f"b{i}" for i in range(250)], vectors[250:], collection="b")
+    reopened = _store(tmp_path)
+    for s in (store, reopened):
+        assert s.search(vectors[10], top_k=1, diversify=False, collection="b")[0][0].startswith("b")
+        assert all(r[0].startswith("a") for r in s.search(vectors[10], top_k=20, diversify=False, collection="a"))
+        assert s.search(vectors[10], top_k=5, collection="missing") == []
+        assert s.search(vectors[10], top_k=1, diversify=False)[0][0] == "a10"
+
+
+@pytest.mark.parametrize("quantization", ["halfvec", "int8", "binary"])
+def test_quantized_search_matches_exact_cosine_after_rescoring(tmp_path, quantization):
+    # clustered, as real embeddings are; equidistant random points would
+    # leave the coarse pass nothing to rank by
+    dim = 128
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, dim))
+    vectors = (centers[rng.integers(0, 40, 2000)] + rng.normal(scale=0.3, size=(2000, dim))).astype(np.float32)
+    texts = [f"t{i}" for i in range(len(vectors))]
+    path = str(tmp_path / "index")
+    LocalVectorStore(path, dim=dim, metric="cosine").add(texts, vectors)
+    exact = LocalVectorStore(path, dim=dim, metric="cosine")
+    store = LocalVectorStore(path, dim=dim, metric="cosine", quantization=quantization)
+    # queries near stored rows, as real questions are near their answers
+    noise = np.random.default_rng(1).normal(scale=0.3, size=(20, dim)).astype(np.float32)
+    for q in vectors[:20] + noise:
+        expected = exact.search(q, top_k=5, diversify=False)
+        got = store.search(q, top_k=5, diversify=False)
+        # the codes only pick RESCORE_CANDIDATES rows; their scores are exact
+        assert [r[0] for r in got] == [r[0] for r in expected]
+        assert [r[2] for r in got] == pytest.approx([r[2] for r in expected], rel=1e-5)
+    assert store.memory_bytes()["codes"] < exact.memory_bytes()["float32"]
@@ -0,0 +1,136 @@
+import pytest
+
+import registry
+import vector_store
+from vector_store import content_hash
+
+COLLECTION = "default"
+
+
+class FakeDB:
+    """The slice of Postgres the registry uses: the documents and
+    document_registry tables, plus a log of the advisory locks taken."""
+
+    def __init__(self):
+        self.documents = set()   # content hashes
+        self.registry = {}       # doc_key -> {file_hash, version, chunk_hashes}
+        self.locks = []
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.db = conn.db
+        self.rows = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        db = self.db
+        if "pg_advisory_xact_lock" in sql:
+            db.locks.append(params[0])
+        elif "file_hash = %s" in sql:
+            self.rows = [(k, r["version"]) for k, r in db.registry.items() if r["file_hash"] == params[1]][:1]
+        elif sql.startswith("SELECT file_hash, version, chunk_hashes"):
+            r = db.registry.get(params[1])
+            self.rows = [(r["file_hash"], r["version"], list(r["chunk_hashes"]))] if r else []
+        elif sql.startswith("SELECT content_hash FROM documents"):
+            self.rows = [(h,) for h in params[1] if h in db.documents]
+        elif sql.strip().startswith("DELETE FROM documents"):
+            claimed = {h for k, r in db.registry.items() if k != params["doc_key"] for h in r["chunk_hashes"]}
+            removed = {h for h in params["stale"] if h in db.documents and h not in claimed}
+            db.documents -= removed
+            self.rowcount = len(removed)
+        elif sql.strip().startswith("INSERT INTO document_registry"):
+            r = db.registry.get(params["doc_key"])
+            version = r["version"] + 1 if r else 1
+            db.registry[params["doc_key"]] = {
+                "file_hash": params["file_hash"], "version": version, "chunk_hashes": list(params["chunk_hashes"]),
+            }
+            self.rows = [(version,)]
+        elif not sql.startswith("UPDATE ingest_state"):
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(vector_store, "_collections_ready", {COLLECTION})
+    db = FakeDB()
+    # "old.pdf" v1 owns the chunk "shared"; its v2 drops it
+    db.documents.add(content_hash("shared"))
+    db.registry["old.pdf"] = {"file_hash": "v1", "version": 1, "chunk_hashes": [content_hash("shared")]}
+    return db
+
+
+def _file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_open_sessions_do_not_block_each_other(db, tmp_path):
+    registry.open_session(FakeConn(db), "new.pdf", _file(tmp_path, "new.pdf", b"new"), COLLECTION)
+    registry.open_session(FakeConn(db), "old.pdf", _file(tmp_path, "old.pdf", b"v2"), COLLECTION)
+    assert not db.locks
+
+
+def test_finish_keeps_chunks_registered_by_an_earlier_finish(db, tmp_path):
+    session, _ = registry.open_session(FakeConn(db), "new.pdf", _file(tmp_path, "new.pdf", b"new"), COLLECTION)
+    assert session.filter_new(["shared"]) == []
+    other, _ = registry.open_session(FakeConn(db), "old.pdf", _file(tmp_path, "old.pdf", b"v2"), COLLECTION)
+    other.filter_new([])
+
+    session.finish(1)
+    assert other.finish(1)["chunks_removed"] == 0
+    assert content_hash("shared") in db.documents
+    assert db.locks == [COLLECTION, COLLECTION]
+
+
+def test_finish_detects_reused_chunks_removed_meanwhile(db, tmp_path):
+    session, _ = registry.open_session(FakeConn(db), "new.pdf", _file(tmp_path, "new.pdf", b"new"), COLLECTION)
+    assert session.filter_new(["shared"]) == []
+    # "old.pdf" v2 finishes first and drops the chunk "new.pdf" reused
+    other, _ = registry.open_session(FakeConn(db), "old.pdf", _file(tmp_path, "old.pdf", b"v2"), COLLECTION)
+    other.filter_new([])
+    assert other.finish(1)["chunks_removed"] == 1
+
+    with pytest.raises(registry.RegistryConflict):
+        session.finish(1)
+    assert "new.pdf" not in db.registry
+
+
+def test_sessions_sharing_a_connection_keep_claimed_chunks(db, tmp_path):
+    conn = FakeConn(db)
+    session, _ = registry.open_session(conn, "new.pdf", _file(tmp_path, "new.pdf", b"new"), COLLECTION)
+    session.filter_new(["shared"])
+    other, _ = registry.open_session(conn, "old.pdf", _file(tmp_path, "old.pdf", b"v2"), COLLECTION)
+    other.filter_new([])
+
+    assert other.finish(1, keep=session.chunk_hashes)["chunks_removed"] == 0
+    session.finish(1)
+    assert content_hash("shared") in db.documents
@@ -0,0 +1,37 @@
+import numpy as np
+
+from rerank import mmr, mmr_rerank, parse_vector
+
+
+def test_mmr_prefers_a_distinct_chunk_over_a_near_duplicate():
+    rows = [
+        ("t1", 1, 0.9, np.array([1.0, 0.0, 0.0])),
+        ("t2", 1, 0.89, np.array([1.0, 0.0, 0.01])),
+        ("t3", 2, 0.5, np.array([0.0, 1.0, 0.0])),
+    ]
+    assert [row[0] for row in mmr_rerank(rows, 2, lambda_mult=0.7)] == ["t1", "t3"]
+
+
+def test_mmr_with_lambda_one_keeps_score_order():
+    candidates = np.array([[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]])
+    assert mmr([0.9, 0.89, 0.5], candidates, 3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_rrf_scores_are_scaled_to_similarity_units():
+    # RRF scores are ~0.03 at most; unscaled, redundancy would swamp them
+    rows = [
+        ("t1", 1, 0.032, np.array([1.0, 0.0])),
+        ("t2", 1, 0.031, np.array([0.0, 1.0])),
+        ("t3", 1, 0.010, np.array([0.0, 0.9])),
+    ]
+    picked = mmr_rerank(rows, 3, lambda_mult=0.7, score_scale=2 / 61)
+    assert [row[0] for row in picked] == ["t1", "t2", "t3"]
+
+
+def test_mmr_rerank_drops_duplicate_texts_and_the_embedding_column():
+    rows = [("same", 1, 0.9, "[1,0]"), ("same ", 2, 0.8, "[1,0]"), ("other", 3, 0.7, "[0,1]")]
+    assert mmr_rerank(rows, 5) == [("same", 1, 0.9), ("other", 3, 0.7)]
+
+
+def test_parse_vector():
+    assert parse_vector("[0.5,-1,2]").tolist() == [0.5, -1.0, 2.0]
@@ -0,0 +1,559 @@
+import os
+import hashlib
+from typing import List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+from embedder import EMBEDDING_DIM
+from rerank import MMR_CANDIDATES, MMR_ENABLED, mmr_rerank
+
+STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", "500"))
+# one metric for the index and every query: cosine | l2 | ip
+VECTOR_METRIC = os.getenv("VECTOR_METRIC", "cosine").lower()
+# hnsw | ivfflat | none
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0")) or None
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0")) or None
+# vector | hybrid (full-text + vector fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "english")
+# rows ingested without a collection, and everything stored before
+# collections existed, live here
+DEFAULT_COLLECTION = "default"
+# a partial ANN index per collection, so scoped searches only walk that
+# collection's graph (or lists)
+COLLECTION_INDEXES = os.getenv("COLLECTION_INDEXES", "1") == "1"
+# without per-collection indexes a scoped search filters the shared index's
+# hits afterwards; iterative scans (pgvector >= 0.8) keep walking the
+# index until enough rows of the collection are found
+ITERATIVE_SCAN = os.getenv("ITERATIVE_SCAN", "1") == "1"
+# none | halfvec | binary | int8: the first pass walks a compact copy of
+# each embedding and RESCORE_CANDIDATES hits are re-scored against the
+# full vectors. Postgres indexes an embedding::halfvec or binary_quantize()
+# expression (pgvector >= 0.7); int8 only applies to the local store.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+RESCORE_CANDIDATES = int(os.getenv("RESCORE_CANDIDATES", "100"))
+
+_METRICS = {
+    # operator, index opclass, expression turning distance into a similarity
+    "cosine": ("<=>", "vector_cosine_ops", "1 - ({dist})"),
+    "l2": ("<->", "vector_l2_ops", "-({dist})"),
+    "ip": ("<#>", "vector_ip_ops", "-({dist})"),
+}
+if VECTOR_METRIC not in _METRICS:
+    raise ValueError(f"VECTOR_METRIC must be one of {sorted(_METRICS)}, got {VECTOR_METRIC!r}")
+DISTANCE_OP, _OPCLASS, _SIMILARITY = _METRICS[VECTOR_METRIC]
+if VECTOR_QUANTIZATION not in ("none", "halfvec", "binary", "int8"):
+    raise ValueError(f"VECTOR_QUANTIZATION must be none, halfvec, binary or int8, got {VECTOR_QUANTIZATION!r}")
+# pgvector has no int8 type
+PG_QUANTIZATION = "none" if VECTOR_QUANTIZATION == "int8" else VECTOR_QUANTIZATION
+
+SCHEMA_SQL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE TABLE IF NOT EXISTS documents (
+    id BIGSERIAL PRIMARY KEY,
+    text TEXT NOT NULL,
+    embedding vector
+);
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS page INT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS char_offset INT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS char_end INT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS collection TEXT NOT NULL DEFAULT 'default';
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS doc_key TEXT;
+-- the same text may be stored once per collection
+DROP INDEX IF EXISTS documents_content_hash_key;
+CREATE UNIQUE INDEX IF NOT EXISTS documents_collection_content_hash_key ON documents (collection, content_hash);
+CREATE INDEX IF NOT EXISTS documents_collection_doc_key_idx ON documents (collection, doc_key);
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO collections (name) VALUES ('default') ON CONFLICT (name) DO NOTHING;
+CREATE INDEX IF NOT EXISTS documents_id_idx ON documents (id);
+-- lexical side of hybrid retrieval
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('{text_search_config}', text)) STORED;
+CREATE INDEX IF NOT EXISTS documents_tsv_idx ON documents USING gin (tsv);
+-- one row per ingested source document; see registry.py
+CREATE TABLE IF NOT EXISTS document_registry (
+    collection TEXT NOT NULL DEFAULT 'default',
+    doc_key TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    version INT NOT NULL DEFAULT 1,
+    chunk_hashes TEXT[] NOT NULL DEFAULT '{{}}',
+    pages INT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (collection, doc_key)
+);
+CREATE INDEX IF NOT EXISTS document_registry_file_hash_idx ON document_registry (collection, file_hash);
+CREATE INDEX IF NOT EXISTS document_registry_chunk_hashes_idx ON document_registry USING gin (chunk_hashes);
+-- bumped whenever documents changes; answer caches key on it
+CREATE TABLE IF NOT EXISTS ingest_state (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO ingest_state (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# one-off data migrations, applied in order after SCHEMA_SQL and recorded
+# in schema_migrations so they never run again
+MIGRATIONS = [
+    # hash rows stored before content_hash existed; copies of a text that
+    # is already stored in the same collection are deleted
+    (1, """
+DELETE FROM documents d
+USING (
+    SELECT ctid, row_number() OVER (PARTITION BY collection, md5(text) ORDER BY ctid) AS copy
+    FROM documents
+    WHERE content_hash IS NULL
+) dup
+WHERE d.ctid = dup.ctid AND dup.copy > 1;
+DELETE FROM documents d
+WHERE d.content_hash IS NULL
+  AND EXISTS (SELECT 1 FROM documents o WHERE o.collection = d.collection AND o.content_hash = md5(d.text));
+UPDATE documents SET content_hash = md5(text) WHERE content_hash IS NULL;
+"""),
+]
+
+INGEST_VERSION_SQL = "SELECT version FROM ingest_state WHERE id = 1"
+BUMP_INGEST_VERSION_SQL = "UPDATE ingest_state SET version = version + 1 WHERE id = 1"
+
+_schema_ready = False
+_collections_ready = set()
+
+
+def content_hash(text: str) -> str:
+    # matches Postgres md5(text) so the SQL migration agrees with new rows
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def vector_literal(embedding: Sequence[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def ensure_schema(conn) -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    if VECTOR_QUANTIZATION != PG_QUANTIZATION:
+        print(f"WARNING: VECTOR_QUANTIZATION={VECTOR_QUANTIZATION} is local store only; Postgres searches full vectors")
+    with conn.cursor() as cur:
+        # concurrent startups take turns; the commit releases the lock
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+        cur.execute(SCHEMA_SQL.format(text_search_config=TEXT_SEARCH_CONFIG))
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+        for version, sql in MIGRATIONS:
+            if version not in applied:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+    conn.commit()
+    ensure_index(conn)
+    _schema_ready = True
+
+
+def _index_kind(metric: str) -> str:
+    return metric if PG_QUANTIZATION == "none" else f"{metric}_{PG_QUANTIZATION}"
+
+
+def index_name(method: str = VECTOR_INDEX, metric: str = VECTOR_METRIC) -> str:
+    return f"documents_embedding_{method}_{_index_kind(metric)}_idx"
+
+
+def collection_index_name(collection: str, method: str = VECTOR_INDEX, metric: str = VECTOR_METRIC) -> str:
+    # collection names are arbitrary text; a digest keeps the identifier
+    # short and safe
+    slug = hashlib.md5(collection.encode("utf-8")).hexdigest()[:12]
+    return f"documents_embedding_{method}_{_index_kind(metric)}_c{slug}_idx"
+
+
+def _index_target(metric: str) -> Tuple[str, str]:
+    """(indexed expression, opclass); quantized expressions must match
+    coarse_distance_sql() exactly for the planner to use the index."""
+    if PG_QUANTIZATION == "halfvec":
+        return f"(embedding::halfvec({EMBEDDING_DIM}))", _METRICS[metric][1].replace("vector_", "halfvec_")
+    if PG_QUANTIZATION == "binary":
+        return f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops"
+    return "embedding", _METRICS[metric][1]
+
+
+def _create_ann_index(cur, name: str, method: str, metric: str, collection: Optional[str] = None) -> None:
+    expr, opclass = _index_target(metric)
+    where, where_params = ("", ()) if collection is None else (" WHERE collection = %s", (collection,))
+    if method == "hnsw":
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON documents "
+            f"USING hnsw ({expr} {opclass}) WITH (m = %s, ef_construction = %s){where}",
+            (HNSW_M, HNSW_EF_CONSTRUCTION, *where_params),
+        )
+    elif method == "ivfflat":
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON documents "
+            f"USING ivfflat ({expr} {opclass}) WITH (lists = %s){where}",
+            (IVFFLAT_LISTS, *where_params),
+        )
+    elif method != "none":
+        raise ValueError(f"VECTOR_INDEX must be hnsw, ivfflat or none, got {method!r}")
+
+
+def ensure_index(conn, method: str = VECTOR_INDEX, metric: str = VECTOR_METRIC) -> None:
+    """Create the ANN index for the configured metric (plus one partial
+    index per collection) and drop embedding indexes built for a
+    different method or metric."""
+    target = index_name(method, metric) if method != "none" else None
+    partial_prefix = f"documents_embedding_{method}_{_index_kind(metric)}_c"
+    with conn.cursor() as cur:
+        # ANN indexes need a fixed dimension on the column
+        cur.execute(
+            "SELECT atttypmod FROM pg_attribute "
+            "WHERE attrelid = 'documents'::regclass AND attname = 'embedding'"
+        )
+        row = cur.fetchone()
+        if row and row[0] <= 0:
+            cur.execute(f"ALTER TABLE documents ALTER COLUMN embedding TYPE vector({EMBEDDING_DIM})")
+        cur.execute(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE tablename = 'documents' AND indexname LIKE 'documents\\_embedding\\_%'"
+        )
+        for (name,) in cur.fetchall():
+            keep = name == target or (COLLECTION_INDEXES and target and name.startswith(partial_prefix))
+            if not keep:
+                cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+        if target:
+            _create_ann_index(cur, target, method, metric)
+            if COLLECTION_INDEXES:
+                cur.execute("SELECT name FROM collections")
+                for (collection,) in cur.fetchall():
+                    _create_ann_index(cur, collection_index_name(collection, method, metric), method, metric, collection)
+    conn.commit()
+
+
+def ensure_collection(conn, collection: str) -> None:
+    """Register a collection and build its partial ANN index; commits."""
+    if collection in _collections_ready:
+        return
+    ensure_schema(conn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO collections (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (collection,))
+        if COLLECTION_INDEXES and VECTOR_INDEX != "none":
+            _create_ann_index(cur, collection_index_name(collection), VECTOR_INDEX, VECTOR_METRIC, collection)
+    conn.commit()
+    _collections_ready.add(collection)
+
+
+def distance_sql(column: str = "embedding", query: str = "%(q)s::vector") -> str:
+    return f"{column} {DISTANCE_OP} {query}"
+
+
+def similarity_sql(column: str = "embedding", query: str = "%(q)s::vector") -> str:
+    return _SIMILARITY.format(dist=distance_sql(column, query))
+
+
+def coarse_distance_sql(query: str = "%(q)s::vector") -> str:
+    """Distance over the quantized copy the ANN index is built on."""
+    if PG_QUANTIZATION == "halfvec":
+        return f"embedding::halfvec({EMBEDDING_DIM}) {DISTANCE_OP} ({query})::halfvec({EMBEDDING_DIM})"
+    if PG_QUANTIZATION == "binary":
+        return f"binary_quantize(embedding)::bit({EMBEDDING_DIM}) <~> binary_quantize({query})"
+    return distance_sql(query=query)
+
+
+def _source_sql(scope: str, query: str = "%(q)s::vector", indent: str = "\n        ") -> str:
+    """FROM target for an ANN scan. Quantized, it is the RESCORE_CANDIDATES
+    nearest rows by coarse distance; the caller's ORDER BY on the full
+    vectors then re-scores them."""
+    if PG_QUANTIZATION == "none":
+        return f"documents{indent}{scope}"
+    return (
+        f"(SELECT id, text, page, embedding FROM documents {scope.strip()}{' ' if scope else ''}"
+        f"ORDER BY {coarse_distance_sql(query)} LIMIT %(rescore)s) documents{indent}"
+    )
+
+
+def search_settings(ef_search: Optional[int] = None, probes: Optional[int] = None,
+                    scoped: bool = False) -> List[str]:
+    """SET LOCAL statements for per-query ANN tuning; they only last for the
+    current transaction so pooled connections are left untouched. `scoped`
+    marks a search restricted to one collection."""
+    ef_search = ef_search or HNSW_EF_SEARCH
+    probes = probes or IVFFLAT_PROBES
+    if PG_QUANTIZATION != "none":
+        # an HNSW scan returns at most ef_search rows
+        ef_search = max(ef_search or 0, RESCORE_CANDIDATES)
+    stmts = []
+    if ef_search and VECTOR_INDEX == "hnsw":
+        stmts.append(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+    if probes and VECTOR_INDEX == "ivfflat":
+        stmts.append(f"SET LOCAL ivfflat.probes = {int(probes)}")
+    if scoped and not COLLECTION_INDEXES and ITERATIVE_SCAN:
+        if VECTOR_INDEX == "hnsw":
+            stmts.append("SET LOCAL hnsw.iterative_scan = strict_order")
+        elif VECTOR_INDEX == "ivfflat":
+            stmts.append("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+    return stmts
+
+
+_VECTOR_SQL = """
+SELECT text, page, {similarity} AS score{embedding_col}
+FROM {source}ORDER BY {distance}
+LIMIT %(limit)s
+"""
+
+# Both candidate lists come from their own index (ANN and GIN); rows are
+# scored by reciprocal rank fusion: sum of 1 / (RRF_K + rank) per list.
+_HYBRID_SQL = """
+WITH vec AS (
+    SELECT id, row_number() OVER (ORDER BY dist) AS rank
+    FROM (
+        SELECT id, {distance} AS dist
+        FROM {source}ORDER BY {distance}
+        LIMIT %(candidates)s
+    ) v
+),
+lex AS (
+    SELECT id, row_number() OVER (ORDER BY lex_score DESC) AS rank
+    FROM (
+        SELECT id, ts_rank_cd(tsv, query) AS lex_score
+        -- OR the question's terms together; plainto_tsquery would AND them
+        FROM documents, to_tsquery(
+            %(ts_config)s::regconfig,
+            replace(plainto_tsquery(%(ts_config)s::regconfig, %(text)s)::text, ' & ', ' | ')
+        ) query
+        WHERE tsv @@ query{and_scope}
+        ORDER BY lex_score DESC
+        LIMIT %(candidates)s
+    ) l
+)
+SELECT d.text, d.page,
+       (COALESCE(1.0 / (%(rrf_k)s + vec.rank), 0)
+        + COALESCE(1.0 / (%(rrf_k)s + lex.rank), 0))::float8 AS score{embedding_col}
+FROM vec
+FULL OUTER JOIN lex ON lex.id = vec.id
+JOIN documents d ON d.id = COALESCE(vec.id, lex.id)
+ORDER BY score DESC
+LIMIT %(limit)s
+"""
+
+
+# Collection-scoped queries filter on the literal predicate the partial
+# indexes are built with, so the planner can pick that collection's index.
+_SCOPE = "WHERE collection = %(collection)s\n        "
+
+
+def _build_sql(template: str, with_embedding: bool, scoped: bool = False) -> str:
+    return template.format(
+        similarity=similarity_sql(),
+        distance=distance_sql(),
+        embedding_col=", embedding::text" if with_embedding else "",
+        source=_source_sql(_SCOPE if scoped else "", indent="\n" if template is _VECTOR_SQL else "\n        "),
+        and_scope=" AND collection = %(collection)s" if scoped else "",
+    )
+
+
+SEARCH_SQL = _build_sql(_VECTOR_SQL, False)
+HYBRID_SEARCH_SQL = _build_sql(_HYBRID_SQL, False)
+# same queries returning each candidate's vector for re-ranking
+SEARCH_SQL_WITH_EMBEDDING = _build_sql(_VECTOR_SQL, True)
+HYBRID_SEARCH_SQL_WITH_EMBEDDING = _build_sql(_HYBRID_SQL, True)
+# keyed by (hybrid, with_embedding, scoped)
+_SEARCH_SQL = {
+    (hybrid, emb, scoped): _build_sql(_HYBRID_SQL if hybrid else _VECTOR_SQL, emb, scoped)
+    for hybrid in (False, True) for emb in (False, True) for scoped in (False, True)
+}
+
+
+# One statement for a batch of query vectors: each row of the unnested
+# array drives its own ANN scan through the lateral subquery.
+_MULTI_VECTOR_SQL = """
+SELECT q.idx, r.text, r.page, r.score{embedding_col}
+FROM unnest(%(qs)s::vector[]) WITH ORDINALITY AS q(vec, idx)
+CROSS JOIN LATERAL (
+    SELECT text, page, {similarity} AS score, {distance} AS dist{inner_embedding_col}
+    FROM {source}ORDER BY {distance}
+    LIMIT %(limit)s
+) r
+ORDER BY q.idx, r.dist
+"""
+
+
+def _build_multi_sql(with_embedding: bool, scoped: bool = False) -> str:
+    return _MULTI_VECTOR_SQL.format(
+        similarity=similarity_sql(query="q.vec"),
+        distance=distance_sql(query="q.vec"),
+        embedding_col=", r.emb" if with_embedding else "",
+        inner_embedding_col=", embedding::text AS emb" if with_embedding else "",
+        source=_source_sql("WHERE collection = %(collection)s\n    " if scoped else "", "q.vec", "\n    "),
+    )
+
+
+MULTI_SEARCH_SQL = _build_multi_sql(False)
+MULTI_SEARCH_SQL_WITH_EMBEDDING = _build_multi_sql(True)
+_MULTI_SEARCH_SQL = {(emb, scoped): _build_multi_sql(emb, scoped) for emb in (False, True) for scoped in (False, True)}
+
+
+def _search_query(query_embedding, limit, query_text=None, mode=None, with_embedding=False, collection=None):
+    params = {
+        "q": vector_literal(query_embedding), "limit": limit, "collection": collection,
+        "rescore": max(RESCORE_CANDIDATES, limit),
+    }
+    mode = (mode or RETRIEVAL_MODE).lower()
+    hybrid = mode == "hybrid" and bool((query_text or "").strip())
+    if hybrid:
+        params.update({
+            "text": query_text,
+            "ts_config": TEXT_SEARCH_CONFIG,
+            "candidates": max(HYBRID_CANDIDATES, limit),
+            "rrf_k": RRF_K,
+        })
+        params["rescore"] = max(params["rescore"], params["candidates"])
+    return _SEARCH_SQL[(hybrid, with_embedding, collection is not None)], params
+
+
+def _score_scale(params: dict) -> float:
+    # MMR relevance: similarities as they are; RRF scores over their
+    # maximum, reached by a row ranked first in both lists
+    return 2.0 / (params["rrf_k"] + 1) if "rrf_k" in params else 1.0
+
+
+def _diversify(diversify: Optional[bool]) -> bool:
+    return MMR_ENABLED if diversify is None else diversify
+
+
+def search(conn, query_embedding, top_k: int = 5, ef_search=None, probes=None,
+           query_text: Optional[str] = None, mode: Optional[str] = None,
+           diversify: Optional[bool] = None, collection: Optional[str] = None) -> List[Tuple]:
+    """Top chunks as (text, page, score) rows. With mode="hybrid" and the
+    question text, lexical matches are fused in. Unless diversify=False
+    (or MMR=0), MMR_CANDIDATES rows are fetched and MMR picks `top_k`
+    without near-duplicates. `collection` restricts the search to one
+    collection; None searches all of them."""
+    mmr_on = _diversify(diversify)
+    limit = max(MMR_CANDIDATES, top_k) if mmr_on else top_k
+    sql, params = _search_query(query_embedding, limit, query_text, mode, mmr_on, collection)
+    with conn.cursor() as cur:
+        for stmt in search_settings(ef_search, probes, collection is not None):
+            cur.execute(stmt)
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    conn.rollback()
+    return mmr_rerank(rows, top_k, score_scale=_score_scale(params)) if mmr_on else rows
+
+
+async def asearch(conn, query_embedding, top_k: int = 5, ef_search=None, probes=None,
+                  query_text: Optional[str] = None, mode: Optional[str] = None,
+                  diversify: Optional[bool] = None, collection: Optional[str] = None) -> List[Tuple]:
+    mmr_on = _diversify(diversify)
+    limit = max(MMR_CANDIDATES, top_k) if mmr_on else top_k
+    sql, params = _search_query(query_embedding, limit, query_text, mode, mmr_on, collection)
+    async with conn.transaction():
+        for stmt in search_settings(ef_search, probes, collection is not None):
+            await conn.execute(stmt)
+        cur = await conn.execute(sql, params)
+        rows = await cur.fetchall()
+    return mmr_rerank(rows, top_k, score_scale=_score_scale(params)) if mmr_on else rows
+
+
+async def amulti_search(conn, query_embeddings: Sequence[Sequence[float]], top_k: int = 5,
+                        ef_search=None, probes=None, diversify: Optional[bool] = None,
+                        collection: Optional[str] = None) -> List[List[Tuple]]:
+    """Vector search for several queries in one round trip; returns one
+    list of (text, page, score) rows per query, in input order."""
+    if not query_embeddings:
+        return []
+    mmr_on = _diversify(diversify)
+    limit = max(MMR_CANDIDATES, top_k) if mmr_on else top_k
+    params = {
+        "qs": [vector_literal(q) for q in query_embeddings], "limit": limit, "collection": collection,
+        "rescore": max(RESCORE_CANDIDATES, limit),
+    }
+    async with conn.transaction():
+        for stmt in search_settings(ef_search, probes, collection is not None):
+            await conn.execute(stmt)
+        cur = await conn.execute(_MULTI_SEARCH_SQL[(mmr_on, collection is not None)], params)
+        rows = await cur.fetchall()
+    grouped: List[List[Tuple]] = [[] for _ in query_embeddings]
+    for row in rows:
+        grouped[row[0] - 1].append(tuple(row[1:]))
+    if mmr_on:
+        return [mmr_rerank(group, top_k) for group in grouped]
+    return grouped
+
+
+def _dedupe(chunks, embeddings, pages=None, offsets=None, ends=None,
+            collection: str = DEFAULT_COLLECTION, document: Optional[str] = None) -> List[Tuple]:
+    n = len(chunks)
+    pages = pages if pages is not None else [None] * n
+    offsets = offsets if offsets is not None else [None] * n
+    ends = ends if ends is not None else [None] * n
+    rows = []
+    seen = set()
+    for text, emb, page, offset, end in zip(chunks, embeddings, pages, offsets, ends):
+        text = (text or "").strip()
+        if not text:
+            continue
+        h = content_hash(text)
+        if h in seen:
+            continue
+        seen.add(h)
+        rows.append((text, vector_literal(emb), h, page, offset, end, collection, document))
+    return rows
+
+
+def store_chunks(conn, chunks, embeddings, pages=None, offsets=None, ends=None,
+                 batch_size: int = STORE_BATCH_SIZE, commit: bool = True,
+                 collection: Optional[str] = None, document: Optional[str] = None) -> int:
+    """Bulk insert chunks in one transaction, skipping texts already stored
+    in the same collection. `pages`, `offsets` and `ends` optionally give
+    each chunk's page number and character span within that page; `document`
+    tags the rows with their source. Returns the number of new rows.
+    With commit=False the rows join the caller's open transaction, which
+    is also responsible for bumping the ingest version and having called
+    ensure_collection."""
+    collection = collection or DEFAULT_COLLECTION
+    rows = _dedupe(chunks, embeddings, pages, offsets, ends, collection, document)
+    if not rows:
+        return 0
+    if commit:
+        ensure_collection(conn, collection)
+    inserted = 0
+    try:
+        with conn.cursor() as cur:
+            for i in range(0, len(rows), batch_size):
+                execute_values(
+                    cur,
+                    "INSERT INTO documents "
+                    "(text, embedding, content_hash, page, char_offset, char_end, collection, doc_key) VALUES %s "
+                    "ON CONFLICT (collection, content_hash) DO NOTHING",
+                    rows[i:i + batch_size],
+                    template="(%s, %s::vector, %s, %s, %s, %s, %s, %s)",
+                    page_size=batch_size,
+                )
+                inserted += max(cur.rowcount, 0)
+            if inserted and commit:
+                cur.execute(BUMP_INGEST_VERSION_SQL)
+        if commit:
+            conn.commit()
+    except Exception:
+        if commit:
+            conn.rollback()
+        raise
+    return inserted
+
+
+if __name__ == "__main__":
+    from db_pool import get_conn
+
+    with get_conn() as conn:
+        ensure_schema(conn)
+    print(f"documents schema ready ({VECTOR_INDEX} index, {VECTOR_METRIC} metric, {PG_QUANTIZATION} quantization)")